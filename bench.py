@@ -0,0 +1,167 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+from satellite import Satellite
+from constellation import Constellation
+from topology import great_circle_arcs
+import distributions
+
+# Benchmarks the hot paths over constellation sizes, distributions and routing methods
+# python bench.py --sizes 100 1000 --output results.json --baseline baseline.json
+SIZES = (100, 1000, 10000)
+METHODS = ('train', 'batched', 'dijkstra', 'a_star')
+LARGE_SIZE = 5000 # From this size on, the sparse topology is used and LARGE_SKIPPED methods are skipped unless asked for explicitly
+# 'train' takes minutes per call at 10k (one Python step per hop), 'batched' needs gigabytes of neighbour slots without DELAY_HIGH
+LARGE_SKIPPED = ('train', 'batched')
+REGRESSION_THRESHOLD = 1.2 # A phase regressed when it takes this many times longer than in the baseline
+MIN_SECONDS = 0.001 # Phases faster than this in the baseline are too noisy to compare
+
+def measure(function, repeat=3, memory=True):
+    # Best wall time of repeat calls, then peak traced memory of one more (tracing slows the call down)
+    seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return seconds, peak
+
+def render(state, edges):
+    # Draws the satellites and the arcs of edges offscreen, like SpherePlot.plot_points
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(projection='3d')
+    ax.set_axis_off()
+    coords = state.cartesian()
+    ax.scatter(coords[:, 0], coords[:, 1], coords[:, 2], s=20)
+
+    edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+    arcs = great_circle_arcs(
+        state.longitude[edges[:, 0]], state.latitude[edges[:, 0]],
+        state.longitude[edges[:, 1]], state.latitude[edges[:, 1]]
+    )
+    ax.add_collection(Line3DCollection(arcs, linewidth=1), autolim=False)
+    figure.canvas.draw()
+
+def run(sizes=SIZES, distribution_names=tuple(distributions.DISTRIBUTIONS), methods=None, iterations=100, seed=0, repeat=3, memory=True, settings=None):
+    # Returns one record per (size, distribution, phase, method), settings are applied like Constellation.apply_settings
+    # Without methods or a TOPOLOGY setting, sizes of LARGE_SIZE and more use the sparse topology and skip LARGE_SKIPPED
+    results = []
+    settings = dict(settings or {})
+    constellation = Constellation()
+    constellation.apply_settings(settings)
+    constellation.MAX_ITERATIONS = iterations
+
+    def record(size, distribution, phase, method, function):
+        seconds, peak = measure(function, repeat, memory)
+        results.append({
+            'size': size, 'distribution': distribution, 'phase': phase, 'method': method,
+            'topology': constellation.TOPOLOGY, 'seconds': seconds, 'peak_bytes': peak,
+        })
+        print(f"{phase:>16} {method or '':>10} {size:>6} {distribution:>8}: {seconds:.4f}s", file=sys.stderr)
+
+    for size in sizes:
+        large = size >= LARGE_SIZE
+        constellation.TOPOLOGY = settings.get('TOPOLOGY', 'sparse' if large else Constellation.TOPOLOGY)
+        size_methods = methods or [method for method in METHODS if not (large and method in LARGE_SKIPPED)]
+        for distribution in distribution_names:
+            satellites = distributions.make_satellites(size, distribution, seed)
+            start_index, end_index = (int(i) for i in np.random.default_rng(seed).choice(size, 2, replace=False))
+
+            record(size, distribution, 'precompute', None, lambda: constellation.precompute_matrices(satellites, force=True))
+            record(size, distribution, 'possible_actions', None, lambda: [sat.get_possible_actions() for sat in satellites])
+
+            for method in size_methods:
+                def route(method=method):
+                    np.random.seed(seed)
+                    constellation.reset_q_values()
+                    constellation.route(method, start_index, end_index)
+                record(size, distribution, 'route', method, route)
+
+            flood_map = constellation.flood_path(start_index, end_index)
+            record(size, distribution, 'flood', None, lambda: constellation.flood_path(start_index, end_index))
+
+            edges = [[sat1.index, sat2.index] for sat1, sat2 in flood_map]
+            record(size, distribution, 'render', None, lambda: render(constellation.state, edges))
+    return results
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # Matches records against the baseline, returns (record, baseline seconds, ratio) for every regression
+    key = lambda r: (r['size'], r['distribution'], r['phase'], r['method'])
+    previous = {key(r): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        old = previous.get(key(r))
+        if old is None or old['seconds'] < MIN_SECONDS or old.get('topology', r['topology']) != r['topology']:
+            continue # Timings of another topology aren't comparable
+        ratio = r['seconds'] / old['seconds']
+        print(f"{r['phase']:>16} {r['method'] or '':>10} {r['size']:>6} {r['distribution']:>8}: "
+              f"{old['seconds']:.4f}s -> {r['seconds']:.4f}s ({ratio:.2f}x)", file=sys.stderr)
+        if ratio > threshold:
+            regressions.append((r, old['seconds'], ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark precompute, routing, flooding and rendering")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--distributions', nargs='+', default=list(distributions.DISTRIBUTIONS), choices=list(distributions.DISTRIBUTIONS))
+    parser.add_argument('--methods', nargs='+', help=f"Default {' '.join(METHODS)}, without {' '.join(LARGE_SKIPPED)} from size {LARGE_SIZE}")
+    parser.add_argument('--iterations', type=int, default=100, help="MAX_ITERATIONS for the trained methods")
+    parser.add_argument('--topology', choices=('dense', 'sparse'), help=f"Default {Constellation.TOPOLOGY}, sparse from size {LARGE_SIZE}")
+    parser.add_argument('--delay-high', type=float, default=Satellite.DELAY_HIGH)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per phase, the fastest is kept")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the traced run that records peak memory")
+    parser.add_argument('--output', help="Write results as JSON here instead of stdout")
+    parser.add_argument('--baseline', help="Compare against results saved by an earlier run")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    settings = {'DELAY_HIGH': args.delay_high}
+    if args.topology:
+        settings['TOPOLOGY'] = args.topology
+    results = run(args.sizes, args.distributions, args.methods, args.iterations, args.seed, args.repeat, not args.no_memory, settings)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'topology': args.topology or 'auto', # Each result records the topology it ran with
+            'delay_high': args.delay_high,
+            'iterations': args.iterations,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for r, old, ratio in regressions:
+            print(f"Regression: {r['phase']} {r['method'] or ''} at {r['size']} ({r['distribution']}) {old:.4f}s -> {r['seconds']:.4f}s ({ratio:.2f}x)", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,66 +1,277 @@
+import time
 import numpy as np
 from collections import deque
-from satellite import Satellite
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from satellite import Satellite, ConstellationState, TopologyContext
+from topology import compute_matrices, update_matrices, compute_adjacency, update_adjacency, compute_sparse_adjacency, neighbour_table
+from qtable import QTable, NeighbourQTable, QStore, DestinationQTable
+from shared import SharedArrays
+from metrics import Metrics, EventHook, print_events
+from routing import propagate_longitudes, time_expanded_adjacency, earliest_arrival, shortest_path_tree, great_circle_heuristic, tree_path, RoutingTable
+
+# Settings copied into worker processes, along with the satellite settings of the TopologyContext (TopologyContext.SETTINGS)
+CONSTELLATION_SETTINGS = ('MAX_ITERATIONS', 'MAX_STEPS', 'BATCH_SIZE', 'Q_BACKEND', 'TOPOLOGY', 'TIME_HORIZON', 'CONVERGENCE_INTERVAL', 'CONVERGENCE_WINDOW', 'CONVERGENCE_TOLERANCE')
 
 class Constellation:
     MAX_ITERATIONS = 3000
+    MAX_STEPS = 10000 # Max hops per episode
+    BATCH_SIZE = 64 # Episodes run in lockstep by train_batched
+    CONVERGENCE_INTERVAL = 50 # Episodes between greedy rollouts checking for convergence
+    CONVERGENCE_WINDOW = 500 # Stop once the greedy route stayed the same for this many episodes, 0 always runs MAX_ITERATIONS
+    CONVERGENCE_TOLERANCE = 0.01 # Max relative change of the route's Q-values between checks for it to count as unchanged
+    PROGRESS_INTERVAL = 0.1 # Min seconds between progress events
+    Q_BACKEND = 'dict' # 'dict' keeps a Q dict per satellite, 'array' shares one dense QTable
+    TOPOLOGY = 'dense' # 'dense' precomputes N×N matrices, 'sparse' only stores the neighbour index
+    INCREMENTAL_MAX_FRACTION = 0.5 # Rebuild the whole topology when more satellites than this moved
+    TIME_HORIZON = 30 # Ticks of future topology planned over by time_expanded
+    MAX_DESTINATION_TABLE_BYTES = 1 << 30 # Largest DestinationQTable train_destinations allocates, destinations × N × max degree float32
+    DESTINATION_UPDATE_BLOCK = 1 << 22 # Max entries of the temporaries per destination chunk of a train_destinations update
     iteration_count = 0
+    q_table = None
+    topology_cache = None # Positions and settings the current topology was computed for
+    time_expanded_cache = None # Future topology from the last time_expanded call
+    routing_table = None
+    destination_table = None # Q-values per destination from train_destinations
+    routing_table_topology = None # Neighbour index and availability the routing table was built for
+
+    def __init__(self):
+        self.context = TopologyContext() # Topology and satellite settings of this constellation only
+        self.events = EventHook(self.PROGRESS_INTERVAL) # Listeners of training and flooding events, see metrics.EventHook
+        self.metrics = Metrics() # Counters kept over every run until reset_metrics
+
+    def reset_metrics(self):
+        self.metrics = Metrics()
+
+    def report_progress(self, phase, iteration, total=None, force=False, q_values=None, **data):
+        # Rate-limited progress event with the metrics so far, nothing is computed when no listener would get it
+        # q_values is the array being trained when it isn't the satellites' own Q-values
+        if self.events.due(force):
+            self.metrics.q_size = self.q_size() if q_values is None else int(np.count_nonzero(q_values))
+            self.events.emit('progress', phase=phase, iteration=iteration, total=total, metrics=self.metrics.as_dict(), **data)
+
+    def finish(self, phase, started, path=None, q_values=None, **data):
+        # Ends a training run: records its time, sends a last progress event regardless of rate limiting, then 'finish'
+        self.metrics.add_time('training', time.perf_counter() - started)
+        self.metrics.q_size = self.q_size() if q_values is None else int(np.count_nonzero(q_values))
+        self.report_progress(phase, self.iteration_count, self.MAX_ITERATIONS, force=True, q_values=q_values)
+        if path is not None:
+            data['path'] = [sat.index for sat in path]
+        self.events.emit('finish', phase=phase, iteration=self.iteration_count, metrics=self.metrics.as_dict(), **data)
+
+    def q_size(self):
+        # Number of Q-values learned so far, over whichever backend the satellites use
+        if self.q_table is not None:
+            return int(np.count_nonzero(self.q_table.values))
+        return sum(len(sat.Q) if isinstance(sat.Q, dict) else int(np.count_nonzero(sat.Q)) for sat in self.satellites)
+
+    def precompute_matrices(self, satellites, force=False):
+        started = time.perf_counter()
+        self.adopt(satellites)
+        context = self.context
+
+        # Only rebuild what satellite movement made stale, unless a full rebuild is forced
+        moved = None if force else self.moved_satellites()
+        if moved is None or (len(moved) and (self.TOPOLOGY == 'sparse' or len(moved) > self.INCREMENTAL_MAX_FRACTION * len(satellites))):
+            self.build_topology()
+        elif len(moved):
+            self.update_topology(moved)
+
+        self.topology_cache = {
+            'state': self.state,
+            'settings': self.topology_settings(),
+            'positions': (self.state.longitude.copy(), self.state.latitude.copy(), self.state.height.copy()),
+            'neighbour_indices': context.neighbour_indices,
+        }
+        context.available = self.state.num_connections < context.CONGESTION_HIGH
+        self.metrics.add_time('precompute', time.perf_counter() - started)
 
-    def precompute_matrices(self, satellites):
+    def adopt(self, satellites):
+        # Satellites become rows of one state, their index is their row, reading topology and settings from this context
+        # A set of satellites belongs to one constellation at a time
         self.satellites = satellites
-        num_satellites = len(self.satellites)
-        
-        Satellite.satellites = satellites
-        Satellite.visibility_matrix = np.zeros((num_satellites, num_satellites), dtype=bool)
-        Satellite.distance_matrix = np.zeros((num_satellites, num_satellites))
-        Satellite.latency_matrix = np.empty((num_satellites, num_satellites), dtype=object)
-
-        # Assign index to each satellite 
-        for i, satellite in enumerate(self.satellites):
-            satellite.index = i
-
-        # Loop through every satellite pair to pre-compute state
-        for a in range(num_satellites):
-            for b in range(num_satellites):
-                if a == b: # Same satellite
-                    Satellite.visibility_matrix[a][b] = False
-                    Satellite.distance_matrix[a][b] = 0
-                    Satellite.latency_matrix[a][b] = 'low'
-                else:
-
-                    sat1 = self.satellites[a]
-                    sat2 = self.satellites[b]
-
-                    # Compute visibility
-                    Satellite.visibility_matrix[a][b] = not sat1.out_of_sight(sat2)
-
-                    # Compute distance
-                    distance = sat1.calculate_distance(sat2)
-                    Satellite.distance_matrix[a][b] = distance
-
-                    if distance <= Satellite.DELAY_LOW:
-                        latency = 'low'
-                    elif distance <= Satellite.DELAY_MEDIUM:
-                        latency = 'medium'
-                    else:
-                        latency = 'high'
-
-                    Satellite.latency_matrix[a][b] = latency
+        self.state = ConstellationState.of(satellites)
+        self.state.context = self.context
+        self.context.satellites = satellites
+
+    def build_topology(self):
+        context = self.context
+        if self.TOPOLOGY == 'sparse':
+            # Only pairs within line of sight are stored, other distances are computed when asked for
+            context.visibility_matrix = context.distance_matrix = context.latency_matrix = None
+            context.neighbour_indptr, context.neighbour_indices, context.neighbour_distances = compute_sparse_adjacency(
+                self.state.longitude, self.state.latitude, self.state.height,
+                earth_radius=context.EARTH_RADIUS,
+                delay_high=context.DELAY_HIGH
+            )
+        else:
+            # Compute the state of every satellite pair in one batch
+            context.visibility_matrix, context.distance_matrix, context.latency_matrix = compute_matrices(
+                self.state.longitude, self.state.latitude, self.state.height,
+                earth_radius=context.EARTH_RADIUS,
+                delay_low=context.DELAY_LOW,
+                delay_medium=context.DELAY_MEDIUM
+            )
+            self.build_adjacency()
+
+    def build_adjacency(self):
+        # Neighbour index used by get_possible_actions, congestion is tracked separately in context.available
+        context = self.context
+        context.neighbour_indptr, context.neighbour_indices, context.neighbour_distances = compute_adjacency(
+            context.visibility_matrix, context.distance_matrix, context.DELAY_HIGH
+        )
+
+    def update_topology(self, moved):
+        # Recomputes the rows and columns of the moved satellites in the dense matrices
+        context = self.context
+        update_matrices(
+            (context.visibility_matrix, context.distance_matrix, context.latency_matrix), moved,
+            self.state.longitude, self.state.latitude, self.state.height,
+            earth_radius=context.EARTH_RADIUS,
+            delay_low=context.DELAY_LOW,
+            delay_medium=context.DELAY_MEDIUM
+        )
+        # Only the moved satellites' edges change, the rest of the neighbour index is kept
+        context.neighbour_indptr, context.neighbour_indices, context.neighbour_distances = update_adjacency(
+            (context.neighbour_indptr, context.neighbour_indices, context.neighbour_distances), moved,
+            context.visibility_matrix, context.distance_matrix, context.DELAY_HIGH
+        )
+
+    def topology_settings(self):
+        context = self.context
+        return (self.TOPOLOGY, context.EARTH_RADIUS, context.DELAY_LOW, context.DELAY_MEDIUM, context.DELAY_HIGH)
+
+    def moved_satellites(self):
+        # Indices of satellites whose rows of the topology are stale, or None if it has to be rebuilt from scratch
+        cache = self.topology_cache
+        if (cache is None or cache['state'] is not self.state or cache['settings'] != self.topology_settings()
+                or cache['neighbour_indices'] is not self.context.neighbour_indices): # Topology belongs to something else
+            return None
+
+        longitude, latitude, height = cache['positions']
+        rigid = (latitude == self.state.latitude) & (height == self.state.height)
+        if rigid.any():
+            # Satellites that all rotated by the same longitude keep the same distances and visibility among themselves
+            delta = np.round((self.state.longitude - longitude) % 360, 9) % 360
+            values, counts = np.unique(delta[rigid], return_counts=True)
+            rigid &= delta == values[np.argmax(counts)]
+        return np.nonzero(~rigid)[0]
+
+    def snapshot(self, satellites=None, matrices=True):
+        # Satellite attributes (and precomputed matrices) as plain arrays, enough to rebuild the constellation elsewhere
+        context = self.context
+        state = ConstellationState.of(self.satellites if satellites is None else satellites)
+        arrays = {
+            'longitude': state.longitude.copy(),
+            'latitude': state.latitude.copy(),
+            'height': state.height.copy(),
+            'speed': state.speed.copy(),
+            'num_connections': state.num_connections.copy(),
+        }
+        if matrices:
+            arrays.update({
+                'neighbour_indptr': context.neighbour_indptr,
+                'neighbour_indices': context.neighbour_indices,
+                'neighbour_distances': context.neighbour_distances,
+            })
+            if context.distance_matrix is not None: # Dense topology
+                arrays.update({
+                    'visibility_matrix': context.visibility_matrix,
+                    'distance_matrix': context.distance_matrix,
+                    'latency_matrix': context.latency_matrix,
+                })
+        return arrays
+
+    @staticmethod
+    def satellites_from_snapshot(arrays):
+        state = ConstellationState(arrays['longitude'], arrays['latitude'], arrays['height'], arrays['speed'], arrays['num_connections'])
+        return state.satellites()
+
+    def restore(self, arrays):
+        # Rebuilds the satellites from a snapshot and adopts its matrices without recomputing them
+        context = self.context
+        satellites = self.satellites_from_snapshot(arrays)
+        self.adopt(satellites)
+        context.visibility_matrix = arrays.get('visibility_matrix')
+        context.distance_matrix = arrays.get('distance_matrix')
+        context.latency_matrix = arrays.get('latency_matrix')
+        context.neighbour_indptr = arrays['neighbour_indptr']
+        context.neighbour_indices = arrays['neighbour_indices']
+        context.neighbour_distances = arrays['neighbour_distances']
+        context.available = self.state.num_connections < context.CONGESTION_HIGH
+        return satellites
+
+    def get_settings(self):
+        settings = self.context.settings()
+        settings.update({name: getattr(self, name) for name in CONSTELLATION_SETTINGS})
+        return settings
+
+    def apply_settings(self, settings):
+        for name, value in settings.items():
+            if name in TopologyContext.SETTINGS:
+                setattr(self.context, name, value)
+            elif name in CONSTELLATION_SETTINGS:
+                setattr(self, name, value)
+
+    def reset_q_values(self):
+        # Forgets everything learned, so the next training run starts from zero
+        for sat in self.satellites:
+            sat.Q = {}
+        self.q_table = None
+
+    def attach_q_table(self, backend=None):
+        # Switches every satellite to the given Q backend (defaults to Q_BACKEND), keeping learned values
+        backend = backend or self.Q_BACKEND
+        if self.q_table is not None and len(self.q_table.values) != len(self.satellites):
+            # Satellites were added or deleted since the table was built, so indices were renumbered and the old
+            # values no longer line up with them, forget them instead of converting
+            for sat in self.satellites:
+                if not isinstance(sat.Q, dict):
+                    sat.Q = {}
+            self.q_table = None
+        if backend == 'array':
+            if self.q_table is None:
+                self.q_table = QTable.from_satellites(self.satellites)
+            self.q_table.attach(self.satellites)
+        else:
+            for sat in self.satellites:
+                if not isinstance(sat.Q, dict):
+                    states, actions = np.nonzero(sat.Q)
+                    sat.Q = {(int(s), self.satellites[a]): sat.Q[s, a] for s, a in zip(states, actions)}
+
+    def save_q_values(self, path):
+        # Saves what the satellites learned, with the geometry and thresholds it was learned for
+        QStore.from_satellites(self.satellites, self.state).save(path)
+
+    def load_q_values(self, path, satellites=None):
+        # Warm-starts from saved Q-values if they still fit the constellation, otherwise starts from zero
+        # Returns whether the saved values were used
+        if satellites is not None:
+            self.adopt(satellites)
+        store = QStore.load(path)
+        self.reset_q_values()
+        if not store.compatible(self.state):
+            return False
+        if self.Q_BACKEND == 'array':
+            self.q_table = store.to_table()
+            self.q_table.attach(self.satellites)
+        else:
+            store.to_dicts(self.satellites)
+        return True
 
     def train_iteration(self, start_satellite, end_satellite):
         current_satellite = start_satellite
         path = [current_satellite]
-        max_steps = 10000
         step = 0
         while current_satellite != end_satellite:
-            if step > max_steps:
-                print(f"Max steps exceeded in iteration.")
+            if step > self.MAX_STEPS:
+                self.metrics.max_steps_aborts += 1
                 break
 
             state_current = current_satellite.get_state(end_satellite.index)
             possible_actions = current_satellite.get_possible_actions()
             if not possible_actions:
                 # No possible actions; terminate the episode
+                self.metrics.dead_ends += 1
                 break
 
             action_current = current_satellite.choose_action(
@@ -92,49 +303,284 @@ class Constellation:
 
             if is_final:
                 break
+        self.metrics.add_episode(step)
         return path
 
-    def train(self, satellites, start_index, end_index):
+    def train(self, satellites, start_index, end_index, callback=None):
         self.precompute_matrices(satellites)
+        self.attach_q_table()
+        return self.train_path(start_index, end_index, callback)
+
+    def train_path(self, start_index, end_index, callback=None):
+        # Trains on the already precomputed matrices, until the greedy route converged or MAX_ITERATIONS episodes ran
+        # callback(iteration, path) is called after every episode, training stops early if it returns True
+        # Returns the greedy path over the learned Q-values
         start_satellite = self.satellites[start_index]
         end_satellite = self.satellites[end_index]
+        monitor = ConvergenceMonitor(self, start_satellite, end_satellite)
 
-        print("Starting Q-Learning Training:")
+        self.events.emit('start', phase='training', total=self.MAX_ITERATIONS)
+        started = time.perf_counter()
         for i in range(self.MAX_ITERATIONS):
-            print(f"\t{i+1}/{self.MAX_ITERATIONS}")
             self.iteration_count = i+1
             # Reset connections for all satellites
             # for sat in self.satellites:
             #     sat.num_connections = 0
             
             # Train for one episode
-            optimal_path = self.train_iteration(start_satellite, end_satellite)
+            episode_path = self.train_iteration(start_satellite, end_satellite)
+            monitor.record(episode_path)
+            self.report_progress('training', i+1, self.MAX_ITERATIONS)
+            if callback is not None and callback(i+1, episode_path):
+                break
+            if monitor.check(i+1):
+                self.events.emit('converged', phase='training', iteration=i+1)
+                break
 
-        print("Training complete, optimal path:", [sat.index for sat in optimal_path])
+        optimal_path = monitor.final_path()
+        self.finish('training', started, optimal_path)
         return optimal_path
 
-    def train_wrapper(self, satellites, start_index, end_index, results):
-        try:
-            optimal_path = self.train(satellites, start_index, end_index)
-            results.put(optimal_path)
-        except Exception as e:
-            if e.errno == errno.EPIPE: 
-                pass
-            else:
-                print("error", str(e))
+    def train_batched(self, satellites, start_index, end_index, batch_size=None):
+        # Runs MAX_ITERATIONS episodes in rounds of batch_size, advancing every episode of a round in lockstep
+        # Returns the greedy path over the learned Q-values
+        self.precompute_matrices(satellites)
+        self.attach_q_table()
+        return self.train_batched_path(start_index, end_index, batch_size)
+
+    def run_lockstep(self, current, active, neighbours, valid, q_rows, update, finished, trace=None):
+        # Advances a round of episodes in lockstep until all ended, stuck on a dead end or after MAX_STEPS hops
+        # current and active are updated in place, q_rows(episode, cur) gives the Q-values of the slots each active episode
+        # chooses among, update(episode, cur, choice, nxt, possible) learns from the hops taken and finished(episode, nxt)
+        # marks the episodes that reached their destination, trace gets a copy of current after every step
+        # Returns the hops taken by each episode
+        lengths = np.zeros(len(current), dtype=np.int64)
+        step = 0
+        while active.any():
+            if step > self.MAX_STEPS:
+                self.metrics.max_steps_aborts += int(active.sum())
+                break
+
+            # Episodes stuck on a satellite without possible actions terminate
+            stuck = active & ~valid[current].any(axis=1)
+            self.metrics.dead_ends += int(stuck.sum())
+            active &= ~stuck
+            episode = np.nonzero(active)[0]
+            if len(episode) == 0:
+                break
+            cur = current[episode]
+            possible = valid[cur]
+
+            # Epsilon-greedy selection, picking uniformly among the best actions (or all when exploring)
+            q_values = np.where(possible, q_rows(episode, cur), -np.inf)
+            best = q_values == q_values.max(axis=1, keepdims=True)
+            explore = np.random.rand(len(episode)) < self.context.EPSILON
+            candidates = np.where(explore[:, np.newaxis], possible, best)
+            choice = np.argmax(np.where(candidates, np.random.rand(*candidates.shape), -1), axis=1)
+            nxt = neighbours[cur, choice]
+
+            update(episode, cur, choice, nxt, possible)
+
+            current[episode] = nxt
+            lengths[episode] += 1
+            active[episode[finished(episode, nxt)]] = False
+            if trace is not None:
+                trace.append(current.copy())
+            step += 1
+        return lengths
+
+    def train_batched_path(self, start_index, end_index, batch_size=None):
+        # Batched training on the already precomputed matrices, over a NeighbourQTable (N × max degree actions)
+        # Starts from the satellites' Q-values and writes what it learned back into them, whichever backend they use
+        context = self.context
+        batch_size = batch_size or self.BATCH_SIZE
+        table = NeighbourQTable.from_satellites(self.satellites, context.neighbour_indptr, context.neighbour_indices, context.available)
+        Q = table.values
+        neighbours, valid = table.neighbours, table.valid
+        start_satellite = self.satellites[start_index]
+        end_satellite = self.satellites[end_index]
+
+        # Congestion doesn't change during training, so neither does each satellite's state
+        states = np.array([sat.get_state(end_index) for sat in self.satellites])
+
+        monitor = ConvergenceMonitor(self, start_satellite, end_satellite, table, states)
+
+        def q_rows(episode, cur):
+            return Q[cur, states[cur]]
+
+        def update(episode, cur, choice, nxt, possible):
+            # Same update as Satellite.update_q_value, episodes updating the same entry keep the last write
+            reward = start_satellite.get_reward(states[nxt], nxt == end_index)
+            q_next = np.where(possible, Q[cur, states[nxt]], -np.inf)
+            max_q_next = q_next.max(axis=1)
+            q_current = Q[cur, states[cur], choice]
+            Q[cur, states[cur], choice] = q_current + context.ALPHA * (reward + context.GAMMA * max_q_next - q_current)
+
+        def finished(episode, nxt):
+            return nxt == end_index
+
+        self.events.emit('start', phase='batched training', total=self.MAX_ITERATIONS)
+        started = time.perf_counter()
+        episodes = 0
+        while episodes < self.MAX_ITERATIONS:
+            num_episodes = min(batch_size, self.MAX_ITERATIONS - episodes)
+            current = np.full(num_episodes, start_index)
+            active = current != end_index # Nothing to learn when already at the end satellite, like train_iteration
+            trace = [current.copy()] # Satellite of every episode after each step, an episode's path is its first lengths + 1 rows
+            lengths = self.run_lockstep(current, active, neighbours, valid, q_rows, update, finished, trace)
+
+            # Shortest episode of the round that reached the end satellite, in case the greedy route doesn't
+            reached = np.nonzero(current == end_index)[0]
+            if len(reached):
+                shortest = reached[np.argmin(lengths[reached])]
+                monitor.record([self.satellites[trace[t][shortest]] for t in range(lengths[shortest] + 1)])
+
+            episodes += num_episodes
+            self.iteration_count = episodes
+            self.metrics.add_episodes(lengths)
+            self.report_progress('batched training', episodes, self.MAX_ITERATIONS, q_values=Q)
+            if monitor.check(episodes):
+                self.events.emit('converged', phase='batched training', iteration=episodes)
+                break
+
+        optimal_path = monitor.final_path()
+        table.to_satellites(self.satellites)
+        self.finish('batched training', started, optimal_path, q_values=Q)
+        return optimal_path
+
+    def train_destinations(self, satellites, destination_indices, batch_size=None):
+        # Learns routes towards every given destination in one run, returns the DestinationQTable
+        # The table holds destinations × N × max degree values, raises ValueError above MAX_DESTINATION_TABLE_BYTES
+        # (without DELAY_HIGH the max degree is about 0.4 N, so routes towards every satellite only fit for a few hundred)
+        self.precompute_matrices(satellites)
+        return self.train_destinations_table(destination_indices, batch_size)
+
+    def train_destinations_table(self, destination_indices, batch_size=None):
+        # Lockstep episodes like train_batched, each heading to a random destination from a random satellite
+        # Every hop taken updates the Q-values of all destinations at once (off-policy), reaching a destination ends it
+        context = self.context
+        batch_size = batch_size or self.BATCH_SIZE
+        neighbours, valid = neighbour_table(context.neighbour_indptr, context.neighbour_indices, context.available)
+        table_bytes = DestinationQTable.nbytes(len(destination_indices), neighbours.shape)
+        if table_bytes > self.MAX_DESTINATION_TABLE_BYTES:
+            raise ValueError(
+                f"Q-values for {len(destination_indices)} destinations need {table_bytes / 2**30:.1f} GiB, "
+                f"more than MAX_DESTINATION_TABLE_BYTES, set DELAY_HIGH or train fewer destinations"
+            )
+        table = DestinationQTable(destination_indices, neighbours, valid)
+        Q = table.values
+        destinations = table.destinations
+        num_destinations = len(destinations)
+        # Destinations updated at once, bounds the destinations × batch × max degree temporaries of each step
+        chunk_size = max(1, self.DESTINATION_UPDATE_BLOCK // (batch_size * neighbours.shape[1]))
+
+        # Reward for arriving on each satellite, per destination
+        states = table.state_codes(self.state)
+        arrived = np.arange(len(self.satellites))[np.newaxis, :] == destinations[:, np.newaxis]
+        rewards = self.satellites[0].get_reward(states, arrived)
+
+        def q_rows(episode, cur):
+            # Towards each episode's own destination
+            return Q[goal[episode], cur]
+
+        def update(episode, cur, choice, nxt, possible):
+            # The same hop updates every destination, for which the next satellite is terminal when it's the destination
+            next_valid = valid[nxt]
+            dead_end = ~next_valid.any(axis=1)
+            for start in range(0, num_destinations, chunk_size):
+                chunk = slice(start, start + chunk_size)
+                next_values = np.where(next_valid, Q[chunk, nxt], -np.inf).max(axis=2, initial=-np.inf)
+                next_values[:, dead_end] = 0 # Dead ends are worth nothing more
+                target = rewards[chunk, nxt] + context.GAMMA * np.where(arrived[chunk, nxt], 0, next_values)
+                q_current = Q[chunk, cur, choice]
+                Q[chunk, cur, choice] = q_current + context.ALPHA * (target - q_current)
+
+        def finished(episode, nxt):
+            return nxt == destinations[goal[episode]]
+
+        self.events.emit('start', phase='multi-destination training', total=self.MAX_ITERATIONS)
+        started = time.perf_counter()
+        episodes = 0
+        last_check = 0
+        stable_since = 0
+        next_hops = None
+        while episodes < self.MAX_ITERATIONS:
+            num_episodes = min(batch_size, self.MAX_ITERATIONS - episodes)
+            current = np.random.randint(len(self.satellites), size=num_episodes)
+            goal = np.random.randint(num_destinations, size=num_episodes)
+            active = current != destinations[goal]
+            lengths = self.run_lockstep(current, active, neighbours, valid, q_rows, update, finished)
+
+            episodes += num_episodes
+            self.iteration_count = episodes
+            self.metrics.add_episodes(lengths)
+            self.report_progress('multi-destination training', episodes, self.MAX_ITERATIONS, q_values=Q)
+
+            # Converged once no greedy next hop changed for CONVERGENCE_WINDOW episodes
+            if self.CONVERGENCE_WINDOW and episodes - last_check >= self.CONVERGENCE_INTERVAL:
+                last_check = episodes
+                hops = table.next_hops()
+                if next_hops is None or not np.array_equal(hops, next_hops):
+                    stable_since = episodes
+                next_hops = hops
+                if episodes - stable_since >= self.CONVERGENCE_WINDOW:
+                    self.events.emit('converged', phase='multi-destination training', iteration=episodes)
+                    break
+
+        self.destination_table = table
+        self.finish('multi-destination training', started, q_values=Q, destinations=num_destinations)
+        return table
+
+    def destination_path(self, start_index, end_index):
+        # Greedy path towards end_index over the Q-values learned by train_destinations
+        return [self.satellites[index] for index in self.destination_table.path(start_index, end_index)]
+
+    def greedy_path(self, start_satellite, end_satellite):
+        # Follows the highest Q-value action from each satellite, without exploration
+        current_satellite = start_satellite
+        path = [current_satellite]
+        visited = {current_satellite}
+        while current_satellite != end_satellite:
+            possible_actions = current_satellite.get_possible_actions()
+            if not possible_actions:
+                break
+            state_current = current_satellite.get_state(end_satellite.index)
+            q_values = current_satellite.get_q_values(state_current, possible_actions)
+            current_satellite = possible_actions[int(np.argmax(q_values))]
+            if current_satellite in visited: # Policy loops back on itself
+                break
+            visited.add(current_satellite)
+            path.append(current_satellite)
+        return path
+
+    def path_value(self, path, end_index):
+        # Sum of the Q-values of each hop along path, towards end_index
+        value = 0
+        for current_satellite, next_satellite in zip(path, path[1:]):
+            state = current_satellite.get_state(end_index)
+            value += current_satellite.get_q_values(state, [next_satellite])[0]
+        return value
 
     def flood(self, satellites, start_index, end_index):
+        self.precompute_matrices(satellites)
+        return self.flood_path(start_index, end_index)
+
+    def flood_path(self, start_index, end_index):
+        # Floods on the already precomputed matrices
+        self.events.emit('start', phase='flooding', total=len(self.satellites))
+        started = time.perf_counter()
         connections = []  # To store the connections formed during flooding
         visited = set()    # To keep track of satellites that have already sent the signal
         queue = deque()
 
         # Initialize the flood sequence from start satellite
-        self.precompute_matrices(satellites)
         queue.append(start_index)
         visited.add(start_index)
 
         while queue:
             current_index = queue.popleft()
+            if self.events.due():
+                self.events.emit('progress', phase='flooding', iteration=len(visited), total=len(self.satellites), connections=len(connections))
             neighbouring_satellites = [sat.index for sat in self.satellites[current_index].get_possible_actions()]
 
             for next_index in neighbouring_satellites:
@@ -145,10 +591,145 @@ class Constellation:
 
                     # Check if the end_satellite has been reached
                     if next_index == end_index:
-                        return connections
+                        queue.clear()
+                        break
 
+        self.metrics.add_time('flooding', time.perf_counter() - started)
+        self.events.emit('finish', phase='flooding', iteration=len(visited), reached=end_index in visited,
+                         connections=len(connections), metrics=self.metrics.as_dict())
         return connections
 
+    def time_expanded(self, satellites, start_index, end_index, ticks=None):
+        self.precompute_matrices(satellites)
+        return self.time_expanded_path(start_index, end_index, ticks)
+
+    def time_expanded_path(self, start_index, end_index, ticks=None):
+        # Plans on the topology of the next ticks as satellites keep moving with their speed, one hop per tick
+        # Returns [(satellite, tick), ...], each satellite forwards the packet at its tick (the last one receives it)
+        adjacency = self.time_expanded_topology(ticks or self.TIME_HORIZON)
+        path = earliest_arrival(adjacency, self.context.available, start_index, end_index)
+        return [(self.satellites[index], tick) for index, tick in path]
+
+    def time_expanded_topology(self, ticks):
+        # Neighbour index for each of the next ticks, tick 0 is the current one
+        context = self.context
+        state = self.state
+        current = (context.neighbour_indptr, context.neighbour_indices, context.neighbour_distances)
+        if np.all(state.speed == state.speed[0]):
+            # A common rotation leaves the relative geometry, and so the topology, unchanged
+            return [current] * ticks
+
+        # Satellites that only moved with their speed since the last call still have those ticks ahead of them
+        adjacency = [current]
+        cache = self.time_expanded_cache
+        if (cache is not None and cache['state'] is state and cache['settings'] == self.topology_settings()
+                and np.array_equal(cache['speed'], state.speed) and np.array_equal(cache['latitude'], state.latitude)
+                and np.array_equal(cache['height'], state.height)):
+            for offset, longitudes in enumerate(cache['longitudes']):
+                if np.all(np.abs((longitudes - state.longitude + 180) % 360 - 180) < 1e-9):
+                    adjacency += cache['adjacency'][offset + 1:ticks + offset]
+                    break
+
+        longitudes = propagate_longitudes(state.longitude, state.speed, ticks)
+        adjacency += time_expanded_adjacency(
+            longitudes[len(adjacency):], state.latitude, state.height,
+            earth_radius=context.EARTH_RADIUS,
+            delay_high=context.DELAY_HIGH
+        )
+        self.time_expanded_cache = {
+            'state': state,
+            'settings': self.topology_settings(),
+            'speed': state.speed.copy(),
+            'latitude': state.latitude.copy(),
+            'height': state.height.copy(),
+            'longitudes': longitudes,
+            'adjacency': adjacency,
+        }
+        return adjacency
+
+    def dijkstra(self, satellites, start_index, end_index):
+        self.precompute_matrices(satellites)
+        return self.dijkstra_path(start_index, end_index)
+
+    def dijkstra_path(self, start_index, end_index):
+        # Exact shortest path by distance over the neighbour index, same format as train
+        _, parent = self.shortest_path_tree(start_index, end_index)
+        return [self.satellites[index] for index in tree_path(parent, start_index, end_index)]
+
+    def a_star(self, satellites, start_index, end_index):
+        self.precompute_matrices(satellites)
+        return self.a_star_path(start_index, end_index)
+
+    def a_star_path(self, start_index, end_index):
+        # Same route as dijkstra_path, guided towards the end satellite by the great circle distance
+        heuristic = great_circle_heuristic(
+            self.state.longitude, self.state.latitude, self.state.height, end_index,
+            earth_radius=self.context.EARTH_RADIUS
+        )
+        _, parent = self.shortest_path_tree(start_index, end_index, heuristic)
+        return [self.satellites[index] for index in tree_path(parent, start_index, end_index)]
+
+    def shortest_path_tree(self, start_index, end_index=None, heuristic=None):
+        # Distance from start_index to every satellite and the parent of each on its shortest path
+        context = self.context
+        return shortest_path_tree(
+            context.neighbour_indptr, context.neighbour_indices, context.neighbour_distances,
+            context.available, start_index, end_index, heuristic
+        )
+
+    def build_routing_table(self, satellites=None):
+        # Next hops between all pairs on the current topology, reused by table_path until the topology changes
+        context = self.context
+        if satellites is not None:
+            self.precompute_matrices(satellites)
+        self.routing_table = RoutingTable.build(
+            context.neighbour_indptr, context.neighbour_indices, context.neighbour_distances, context.available
+        )
+        self.routing_table_topology = (context.neighbour_indices, context.available.copy())
+        return self.routing_table
+
+    def table_path(self, start_index, end_index):
+        # Looks the path up in the routing table, which is only rebuilt when the topology changed since it was built
+        topology = self.routing_table_topology
+        if (self.routing_table is None or topology[0] is not self.context.neighbour_indices
+                or not np.array_equal(topology[1], self.context.available)):
+            self.build_routing_table()
+        return [self.satellites[index] for index in self.routing_table.path(start_index, end_index)]
+
+    def route(self, method, start_index, end_index):
+        # Routes one pair on the already precomputed matrices with 'train', 'batched', 'flood', 'dijkstra', 'a_star', 'table' or 'time_expanded'
+        if method == 'train':
+            self.attach_q_table()
+            return self.train_path(start_index, end_index)
+        elif method == 'batched':
+            self.attach_q_table()
+            return self.train_batched_path(start_index, end_index)
+        elif method == 'flood':
+            return self.flood_path(start_index, end_index)
+        elif method == 'dijkstra':
+            return self.dijkstra_path(start_index, end_index)
+        elif method == 'a_star':
+            return self.a_star_path(start_index, end_index)
+        elif method == 'table':
+            return self.table_path(start_index, end_index)
+        elif method == 'time_expanded':
+            return self.time_expanded_path(start_index, end_index)
+        raise ValueError(f"Unknown routing method: {method}")
+
+    def route_pairs(self, satellites, pairs, method='train', max_workers=None):
+        # Routes many (start_index, end_index) pairs on a process pool, yielding (pair, path) as each one finishes
+        # Paths are returned as satellite indices, the matrices are shared with the workers through shared memory
+        self.precompute_matrices(satellites)
+        shared = SharedArrays(self.snapshot())
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_route_worker, initargs=(shared.spec, self.get_settings()))
+        try:
+            futures = {pool.submit(_route_pair, method, start_index, end_index): (start_index, end_index) for start_index, end_index in pairs}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            shared.close()
+
     def compare_routing_methods(self, satellites, start_index=None, end_index=None, mas_optimized_path=[], non_optimized_path=[]):
         # MAS-optimized Path using Q-Learning
         if(non_optimized_path == []): # If a path is passed in then don't re-calculate path
@@ -161,18 +742,28 @@ class Constellation:
         if(non_optimized_path == []): # If a path is passed in then don't re-calculate path
             non_optimized_path = self.flood(satellites=satellites, start_index=start_index, end_index=end_index)
 
+        # Exact shortest path using Dijkstra, the reference the other two are judged against
+        shortest_path = self.dijkstra_path(start_index, end_index)
+
         mas_optimized_stats = {
             'path': [sat.index for sat in mas_optimized_path],
             'distance': 0,
             'num_satellites': len(mas_optimized_path),
-            'true_distance' : Satellite.distance_matrix[start_index][end_index]
+            'true_distance' : self.satellites[start_index].distance_to(end_index)
         }
 
         non_optimized_stats = {
             'path': [[sat[0].index, sat[1].index] for sat in non_optimized_path],
             'distance': 0,
             'num_satellites': len(non_optimized_path),
-            'true_distance' : Satellite.distance_matrix[start_index][end_index]
+            'true_distance' : self.satellites[start_index].distance_to(end_index)
+        }
+
+        shortest_stats = {
+            'path': [sat.index for sat in shortest_path],
+            'distance': 0,
+            'num_satellites': len(shortest_path),
+            'true_distance' : self.satellites[start_index].distance_to(end_index)
         }
 
         # Calculate total distance for MAS-optimized route
@@ -180,16 +771,157 @@ class Constellation:
             for i in range(len(mas_optimized_path) - 1):
                 a = mas_optimized_path[i].index
                 b = mas_optimized_path[i+1].index
-                mas_optimized_stats['distance'] += Satellite.distance_matrix[a][b]
+                mas_optimized_stats['distance'] += self.satellites[a].distance_to(b)
 
         # Calculate total distance for non-optimized route
         if len(non_optimized_path) > 1:
             for i in range(len(non_optimized_path) - 1):
                 a = non_optimized_path[i][0].index
                 b = non_optimized_path[i][1].index
-                non_optimized_stats['distance'] += Satellite.distance_matrix[a][b]
-
-        return {"optimal": mas_optimized_stats, "non-optimal": non_optimized_stats}
+                non_optimized_stats['distance'] += self.satellites[a].distance_to(b)
+
+        # Calculate total distance for shortest route
+        if len(shortest_path) > 1:
+            for i in range(len(shortest_path) - 1):
+                a = shortest_path[i].index
+                b = shortest_path[i+1].index
+                shortest_stats['distance'] += self.satellites[a].distance_to(b)
+
+        return {"optimal": mas_optimized_stats, "non-optimal": non_optimized_stats, "shortest": shortest_stats}
+
+class ConvergenceMonitor:
+    # Greedy rollouts over the Q-values every CONVERGENCE_INTERVAL episodes during training
+    # Training has converged once the greedy route reaches the end satellite and stayed the same, with Q-values along it
+    # changing less than CONVERGENCE_TOLERANCE, for CONVERGENCE_WINDOW episodes
+    # Rolls out over the satellites' Q-values, or over a NeighbourQTable being trained with the state codes of each satellite
+
+    def __init__(self, constellation, start_satellite, end_satellite, table=None, states=None):
+        self.constellation = constellation
+        self.start_satellite = start_satellite
+        self.end_satellite = end_satellite
+        self.table = table
+        self.states = states
+        self.path = None # Greedy route at the last check
+        self.best_episode = None # Shortest episode path that reached the end satellite
+        self.value = None # Sum of Q-values along it
+        self.q_change = np.inf # Relative change of that sum since the check before
+        self.last_check = 0
+        self.stable_since = 0 # Episode since which the route hasn't changed
+
+    def check(self, episode):
+        # Returns True once training has converged, only rolls out when a check is due
+        constellation = self.constellation
+        if not constellation.CONVERGENCE_WINDOW or episode - self.last_check < constellation.CONVERGENCE_INTERVAL:
+            return False
+        self.last_check = episode
+
+        started = time.perf_counter()
+        path, value = self.rollout()
+        constellation.metrics.add_time('convergence', time.perf_counter() - started)
+        if path == self.path:
+            self.q_change = abs(value - self.value) / max(abs(value), 1e-12)
+        else:
+            self.q_change = np.inf
+        if self.q_change > constellation.CONVERGENCE_TOLERANCE:
+            self.stable_since = episode
+        self.path = path
+        self.value = value
+
+        return path[-1] == self.end_satellite and episode - self.stable_since >= constellation.CONVERGENCE_WINDOW
+
+    def rollout(self):
+        # Greedy route over the Q-values as they are now, and the sum of Q-values along it
+        constellation = self.constellation
+        if self.table is None:
+            path = constellation.greedy_path(self.start_satellite, self.end_satellite)
+            return path, constellation.path_value(path, self.end_satellite.index)
+        indices, value = self.table.greedy_path(self.start_satellite.index, self.end_satellite.index, self.states)
+        return [constellation.satellites[index] for index in indices], value
+
+    def record(self, path):
+        # Keeps the shortest episode path that reached the end satellite, with the loops the episode explored cut out
+        if path[-1] != self.end_satellite:
+            return
+        path = remove_loops(path)
+        if self.best_episode is None or len(path) < len(self.best_episode):
+            self.best_episode = path
+
+    def final_path(self):
+        # The greedy route can stop short of the end satellite, on a dead end or where the policy loops, when training ended
+        # before the Q-values along it settled, even though episodes reached it
+        # Falls back to the shortest loop-free episode that did reach it, so callers always get a route that arrives
+        # without revisiting a satellite when one was found
+        self.path, self.value = self.rollout()
+        if self.path[-1] != self.end_satellite and self.best_episode is not None:
+            self.path = self.best_episode
+        return self.path
+
+def remove_loops(path):
+    # Cuts every cycle out of a path, when a satellite shows up again everything after its first visit is dropped
+    result = []
+    positions = {}
+    for sat in path:
+        position = positions.get(sat)
+        if position is not None:
+            for dropped in result[position + 1:]:
+                del positions[dropped]
+            del result[position + 1:]
+        else:
+            positions[sat] = len(result)
+            result.append(sat)
+    return result
+
+# Per-process state of route_pairs workers
+_worker_blocks = None
+_worker_constellation = None
+
+def _init_route_worker(spec, settings):
+    global _worker_blocks, _worker_constellation
+    _worker_blocks, arrays = SharedArrays.attach(spec)
+    _worker_constellation = Constellation()
+    _worker_constellation.apply_settings(settings)
+    _worker_constellation.restore(arrays)
+
+def _route_pair(method, start_index, end_index):
+    # Every pair trains from zero, so results don't depend on which pairs a worker handled before
+    _worker_constellation.reset_q_values()
+    path = _worker_constellation.route(method, start_index, end_index)
+    if method == 'flood':
+        return [[sat1.index, sat2.index] for sat1, sat2 in path]
+    if method == 'time_expanded':
+        return [[sat.index, tick] for sat, tick in path]
+    return [sat.index for sat in path]
+
+def train_process(arrays, settings, start_index, end_index, connection, cancel_event):
+    # Entry point of a training subprocess, streams messages over connection:
+    # ('progress', iteration, best_path, metrics), then one of ('result', path), ('cancelled',) or ('error', message)
+    constellation = Constellation()
+    constellation.apply_settings(settings)
+    satellites = Constellation.satellites_from_snapshot(arrays)
+    best_path = [] # Shortest episode that reached the end satellite so far
+
+    def report(iteration, path):
+        nonlocal best_path
+        if path[-1].index == end_index and (not best_path or len(path) < len(best_path)):
+            best_path = [sat.index for sat in path]
+        return cancel_event.is_set()
+
+    def send_progress(event, data):
+        if event == 'progress':
+            connection.send(('progress', data['iteration'], best_path, data['metrics']))
+
+    constellation.events.connect(send_progress)
+
+    try:
+        optimal_path = constellation.train(satellites, start_index, end_index, callback=report)
+        if cancel_event.is_set():
+            connection.send(('cancelled',))
+        else:
+            connection.send(('result', [sat.index for sat in optimal_path]))
+    except Exception as e:
+        connection.send(('error', str(e)))
+    finally:
+        connection.close()
 
 def test():
     test_size = 1
@@ -205,6 +937,7 @@ def test():
     ]
 
     network = Constellation()
+    network.events.connect(print_events)
     data = []
 
     for _ in range(test_size):
@@ -226,6 +959,7 @@ def test():
         print(" -> True distance between the 2 satellites: %d KM" % (results['optimal']['true_distance']))
         print(" -> Non-optimal Path (Used %3d satellites): %d KM" % (results['non-optimal']['num_satellites'], results['non-optimal']['distance']))
         print(" ->     Optimal Path (Used %3d satellites): %d KM" % (results['optimal']['num_satellites'], results['optimal']['distance']))
+        print(" ->    Shortest Path (Used %3d satellites): %d KM" % (results['shortest']['num_satellites'], results['shortest']['distance']))
         print()
 
     import json
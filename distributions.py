@@ -0,0 +1,89 @@
+import numpy as np
+from satellite import ConstellationState
+
+# Layouts for a constellation, each writes positions into the given longitude and latitude arrays in place
+# rng is anything with uniform and normal, np.random by default or np.random.default_rng(seed) for repeatable layouts
+
+def grid(longitudes, latitudes, rng=np.random):
+    # Grid Distribution, satellites that don't fit in the square grid keep their positions
+    n = len(longitudes)
+    num_latitudes = int(np.sqrt(n))
+    num_longitudes = int(np.sqrt(n))
+
+    grid_latitudes, grid_longitudes = np.meshgrid(
+        np.linspace(-90, 90, num_latitudes),
+        np.linspace(0, 360, num_longitudes, endpoint=False),
+        indexing='ij'
+    )
+    count = num_latitudes * num_longitudes
+    latitudes[:count] = grid_latitudes.ravel()
+    longitudes[:count] = grid_longitudes.ravel()
+
+def spiral(longitudes, latitudes, rng=np.random):
+    # Golden Ratio Distribution
+    n = len(longitudes)
+    if n < 2:
+        return
+    golden_angle = np.pi * (3 - np.sqrt(5))  # Approximate golden angle in radians
+    i = np.arange(n)
+    latitudes[:] = np.degrees(np.arcsin(-1 + 2 * i / (n - 1)))  # Distribute latitude evenly between -90 and 90
+    longitudes[:] = np.degrees((i * golden_angle) % (2 * np.pi))  # Distribute longitude based on golden angle
+
+def ring(longitudes, latitudes, rng=np.random):
+    n = len(longitudes)
+    latitudes[:] = 0  # All satellites are on the equatorial plane
+    longitudes[:] = np.linspace(0, 360, n, endpoint=False)  # Evenly spaced longitudes around the ring
+
+def random(longitudes, latitudes, rng=np.random):
+    n = len(longitudes)
+    latitudes[:] = rng.uniform(-90, 90, n)
+    longitudes[:] = rng.uniform(0, 360, n)
+
+def split(longitudes, latitudes, rng=np.random):
+    n = len(longitudes)
+    half_n = n // 2
+
+    if(n < 2):
+        return
+
+    # Evenly spaced longitudes, repeated for each hemisphere
+    longitudes[:] = np.linspace(0, 360, half_n, endpoint=False)[np.arange(n) % half_n]
+
+    latitudes[:half_n] = rng.uniform(35, 90, half_n)  # Top hemisphere
+    latitudes[half_n:] = rng.uniform(-90, -35, n - half_n)  # Bottom hemisphere
+
+def cluster(longitudes, latitudes, rng=np.random):
+    n = len(longitudes)
+    # Clustered distribution
+    num_clusters = 5  # Number of clusters
+
+    if n < num_clusters: # Handle edge case
+        num_clusters = n
+    if n == 0:
+        return
+
+    satellites_per_cluster = n // num_clusters
+    center_latitudes = rng.uniform(-90, 90, num_clusters)
+    center_longitudes = rng.uniform(0, 360, num_clusters)
+
+    cluster_idx = (np.arange(n) // satellites_per_cluster) % num_clusters
+    latitude = rng.normal(center_latitudes[cluster_idx], 5)  # Cluster around the center latitude with some variance
+    longitude = rng.normal(center_longitudes[cluster_idx], 10) % 360  # Cluster around the center longitude with some variance
+    latitudes[:] = np.clip(latitude, -90, 90)  # Ensure latitude stays within bounds
+    longitudes[:] = longitude
+
+DISTRIBUTIONS = {
+    'grid': grid,
+    'spiral': spiral,
+    'ring': ring,
+    'random': random,
+    'split': split,
+    'cluster': cluster,
+}
+
+def make_satellites(size, distribution, seed, height=0, speed=0.5):
+    # Seeded constellation, satellites a distribution doesn't place keep random positions
+    rng = np.random.default_rng(seed)
+    state = ConstellationState(rng.uniform(0, 360, size), rng.uniform(-90, 90, size), np.full(size, height), np.full(size, speed))
+    DISTRIBUTIONS[distribution](state.longitude, state.latitude, rng)
+    return state.satellites()
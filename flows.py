@@ -0,0 +1,113 @@
+import numpy as np
+
+class FlowSimulator:
+    # Many concurrent routes (flows) over a constellation, with satellite and link load kept in array counters
+    # Like PathWidget.add_path, a flow adds a connection to every satellite on its path, so congestion states and
+    # the constellation's available mask follow the traffic and routers see it on their next route
+    ROUTERS = ('train', 'batched', 'dijkstra', 'a_star', 'table')
+
+    def __init__(self, constellation, satellites=None):
+        self.constellation = constellation
+        if satellites is not None:
+            constellation.precompute_matrices(satellites)
+        self.flows = {} # Flow id -> (satellite indices, link slots)
+        self.next_id = 0
+        self.rejected = 0 # Flows whose router found no path
+        self.link_index()
+
+    def link_index(self):
+        # Links are the slots of the neighbour index, key start * N + end is sorted along it
+        context = self.constellation.context
+        num_satellites = len(self.constellation.satellites)
+        rows = np.repeat(np.arange(num_satellites), np.diff(context.neighbour_indptr))
+        self.link_keys = rows * num_satellites + context.neighbour_indices
+        self.link_load = np.zeros(len(self.link_keys), dtype=np.int64)
+        self.link_topology = context.neighbour_indices
+
+    def link_slots(self, path, strict=True):
+        # Slots of the links along path, links missing from the topology raise, or are skipped if not strict
+        num_satellites = len(self.constellation.satellites)
+        keys = path[:-1] * num_satellites + path[1:]
+        slots = np.minimum(np.searchsorted(self.link_keys, keys), max(len(self.link_keys) - 1, 0))
+        found = self.link_keys[slots] == keys if len(self.link_keys) else np.zeros(len(keys), dtype=bool)
+        if strict and not found.all():
+            raise ValueError("Path uses a link that isn't in the topology")
+        return slots[found]
+
+    def sync_links(self):
+        # After the topology changed links are counted again, those that no longer exist are dropped
+        if self.constellation.context.neighbour_indices is self.link_topology:
+            return
+        self.link_index()
+        for flow_id, (indices, _) in self.flows.items():
+            slots = self.link_slots(indices, strict=False)
+            np.add.at(self.link_load, slots, 1)
+            self.flows[flow_id] = (indices, slots)
+
+    @property
+    def satellite_load(self):
+        # Connections per satellite, the constellation's own num_connections counters
+        return self.constellation.state.num_connections
+
+    def add_flow(self, path):
+        # Admits a flow along path (satellites or indices), returns its id
+        self.sync_links()
+        indices = np.array([sat if isinstance(sat, (int, np.integer)) else sat.index for sat in path], dtype=np.int64)
+        slots = self.link_slots(indices)
+        self.update_load(indices, slots, 1)
+        flow_id = self.next_id
+        self.next_id += 1
+        self.flows[flow_id] = (indices, slots)
+        return flow_id
+
+    def remove_flow(self, flow_id):
+        self.sync_links()
+        indices, slots = self.flows.pop(flow_id)
+        self.update_load(indices, slots, -1)
+
+    def update_load(self, indices, slots, change):
+        # Only the satellites on the path change congestion state
+        np.add.at(self.satellite_load, indices, change)
+        np.add.at(self.link_load, slots, change)
+        context = self.constellation.context
+        context.available[indices] = self.satellite_load[indices] < context.CONGESTION_HIGH
+
+    def route_flow(self, start_index, end_index, method='dijkstra'):
+        # Routes one flow under the current load and admits it, returns (flow id, path) or (None, []) if it's rejected
+        if method not in self.ROUTERS:
+            raise ValueError(f"Unknown routing method: {method}")
+        available = self.constellation.context.available
+        if not (available[start_index] and available[end_index]): # Already at CONGESTION_HIGH
+            self.rejected += 1
+            return None, []
+        path = self.constellation.route(method, start_index, end_index)
+        if not path or path[-1].index != end_index:
+            self.rejected += 1
+            return None, []
+        return self.add_flow(path), path
+
+    def route_flows(self, pairs, method='dijkstra'):
+        # Routes (start_index, end_index) pairs one after another, each seeing the load of the ones before it
+        return [self.route_flow(start_index, end_index, method) for start_index, end_index in pairs]
+
+    def clear(self):
+        for flow_id in list(self.flows):
+            self.remove_flow(flow_id)
+        self.rejected = 0
+
+    def utilization(self):
+        # Load report, utilization is connections relative to CONGESTION_HIGH
+        load = self.satellite_load
+        congestion_high = self.constellation.context.CONGESTION_HIGH
+        utilization = load / congestion_high
+        return {
+            'flows': len(self.flows),
+            'rejected': self.rejected,
+            'satellite_load': load.copy(),
+            'satellite_utilization': utilization,
+            'mean_utilization': float(utilization.mean()) if len(load) else 0.0,
+            'max_utilization': float(utilization.max(initial=0)),
+            'congested': int(np.count_nonzero(load >= congestion_high)),
+            'link_load': self.link_load.copy(),
+            'max_link_load': int(self.link_load.max(initial=0)),
+        }
@@ -0,0 +1,81 @@
+import time
+import numpy as np
+
+class Metrics:
+    # Counters collected by a Constellation while it trains and floods, kept until reset_metrics
+
+    def __init__(self):
+        self.episodes = 0
+        self.steps = 0 # Hops taken over all episodes
+        self.max_episode_steps = 0
+        self.max_steps_aborts = 0 # Episodes cut off after MAX_STEPS hops
+        self.dead_ends = 0 # Episodes ended on a satellite without possible actions
+        self.q_size = 0 # Non-zero Q-values, refreshed with every progress event and at the end of training
+        self.phase_seconds = {} # Wall time per phase: 'precompute', 'training', 'convergence' (checks, also counted in training) and 'flooding'
+
+    def add_episode(self, steps):
+        self.episodes += 1
+        self.steps += steps
+        self.max_episode_steps = max(self.max_episode_steps, steps)
+
+    def add_episodes(self, steps):
+        # Episodes run in lockstep, steps holds the hops taken by each one
+        if len(steps):
+            self.episodes += len(steps)
+            self.steps += int(np.sum(steps))
+            self.max_episode_steps = max(self.max_episode_steps, int(np.max(steps)))
+
+    def add_time(self, phase, seconds):
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0) + seconds
+
+    def as_dict(self):
+        return {
+            'episodes': self.episodes,
+            'steps': self.steps,
+            'mean_episode_steps': self.steps / self.episodes if self.episodes else 0,
+            'max_episode_steps': self.max_episode_steps,
+            'max_steps_aborts': self.max_steps_aborts,
+            'dead_ends': self.dead_ends,
+            'q_size': self.q_size,
+            'phase_seconds': dict(self.phase_seconds),
+        }
+
+class EventHook:
+    # Calls every connected listener(event, data) with each event emitted
+    # Constellation emits 'start', 'progress', 'converged' and 'finish', each with the 'phase' they belong to
+
+    def __init__(self, interval=0.1):
+        self.listeners = []
+        self.interval = interval # Min seconds between progress events
+        self.last_progress = -np.inf
+
+    def connect(self, listener):
+        self.listeners.append(listener)
+
+    def disconnect(self, listener):
+        self.listeners.remove(listener)
+
+    def emit(self, event, **data):
+        for listener in self.listeners:
+            listener(event, data)
+
+    def due(self, force=False):
+        # Whether a progress event should be sent now, nothing is due without listeners
+        if not self.listeners:
+            return False
+        now = time.monotonic()
+        if force or now - self.last_progress >= self.interval:
+            self.last_progress = now
+            return True
+        return False
+
+def print_events(event, data):
+    # Listener reporting training on stdout, for command-line runs
+    if event == 'start':
+        print(f"Starting {data['phase']}:")
+    elif event == 'progress' and 'total' in data:
+        print(f"\t{data['iteration']}/{data['total']}")
+    elif event == 'converged':
+        print(f"Converged after {data['iteration']} episodes")
+    elif event == 'finish' and 'path' in data:
+        print(f"{data['phase'].capitalize()} complete, optimal path:", data['path'])
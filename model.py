@@ -1,17 +1,22 @@
 import sys
 import numpy as np
+from itertools import chain
 from PyQt5 import QtWidgets, QtCore
 from PyQt5.QtWidgets import (
-    QListWidget, QSlider, QLabel, QVBoxLayout, QHBoxLayout, QWidget, QFormLayout, QPushButton, QTabWidget, QMenuBar, QAction, QSpinBox, QDoubleSpinBox, QProgressBar
+    QListView, QSlider, QLabel, QVBoxLayout, QHBoxLayout, QWidget, QFormLayout, QPushButton, QTabWidget, QMenuBar, QAction, QSpinBox, QDoubleSpinBox, QProgressBar
 )
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
+from matplotlib.colors import to_rgba_array
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 
-from multiprocessing import Queue
-from PyQt5.QtCore import QThread, pyqtSignal, QObject
+from multiprocessing import Process, Pipe, Event
+from PyQt5.QtCore import pyqtSignal, QObject, QAbstractListModel, QModelIndex, QItemSelectionModel
 
-from satellite import Satellite
-from constellation import Constellation
+from satellite import Satellite, ConstellationState
+from constellation import Constellation, train_process
+from topology import great_circle_arcs
+import distributions
 
 # Colour palette 
 COLOUR_LIGHT_BLUE = "#A5A9F4"
@@ -35,6 +40,93 @@ COLOUR_PURPLE_DIM = "#352647"
 
 COLOUR_ORANGE = "#E07636"
 
+class ArcCache:
+    # Great-circle arcs of the (i, j) edges drawn last frame, an arc is only recomputed when an endpoint moves
+
+    def __init__(self, num_points=50):
+        self.num_points = num_points
+        self.keys = np.zeros(0, dtype=np.int64) # Sorted edge keys, i * num_satellites + j
+        self.endpoints = np.zeros((0, 4)) # Longitude and latitude of both endpoints when the arc was computed
+        self.arcs = np.zeros((0, num_points, 3))
+        self.num_satellites = 0
+
+    def get(self, edges, longitudes, latitudes):
+        # Arcs for an (E, 2) array of satellite index pairs, shape (E, num_points, 3)
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        if len(longitudes) != self.num_satellites: # Indices were reassigned, start over
+            self.__init__(self.num_points)
+            self.num_satellites = len(longitudes)
+
+        keys = edges[:, 0] * self.num_satellites + edges[:, 1]
+        endpoints = np.column_stack((longitudes[edges[:, 0]], latitudes[edges[:, 0]], longitudes[edges[:, 1]], latitudes[edges[:, 1]]))
+
+        # Reuse arcs of cached edges whose endpoints haven't moved
+        arcs = np.empty((len(edges), self.num_points, 3))
+        position = np.searchsorted(self.keys, keys).clip(max=max(len(self.keys) - 1, 0))
+        cached = (self.keys[position] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        cached[cached] = (self.endpoints[position[cached]] == endpoints[cached]).all(axis=1)
+        arcs[cached] = self.arcs[position[cached]]
+
+        stale = ~cached
+        if stale.any():
+            arcs[stale] = great_circle_arcs(*endpoints[stale].T, num_points=self.num_points)
+
+        # Keep exactly this frame's edges for the next one
+        keys, unique = np.unique(keys, return_index=True)
+        self.keys = keys
+        self.endpoints = endpoints[unique]
+        self.arcs = arcs[unique]
+        return arcs
+
+class ColourState:
+    # Colour roles of every satellite (on a path, congested, selected, on the selected path) kept as NumPy arrays
+    # update() recomputes them when paths or selections change, frames reuse the RGBA colours in between
+    PATH_COLOURS = to_rgba_array([COLOUR_GREEN, COLOUR_BLUE, COLOUR_PURPLE, COLOUR_RED])
+    WHITE, LIGHT_BLUE, RED, ORANGE = to_rgba_array([COLOUR_WHITE, COLOUR_LIGHT_BLUE, COLOUR_RED, COLOUR_ORANGE])
+
+    def __init__(self):
+        self.rgba = np.zeros((0, 4)) # Scatter colour of each satellite
+        self.edges = np.zeros((0, 2), dtype=np.int64) # Consecutive satellites of every path
+        self.edge_rgba = np.zeros((0, 4))
+
+    def update(self, paths, num_connections, selected_indices, selected_path, flood_colour):
+        num_satellites = len(num_connections)
+        lengths = [len(path) for path in paths]
+        members = np.fromiter(chain.from_iterable(paths), dtype=np.int64, count=sum(lengths))
+        owners = np.repeat(np.arange(len(paths)), lengths)
+
+        # Role masks, a satellite on several paths takes the colour of the last one
+        path_index = np.full(num_satellites, -1)
+        np.maximum.at(path_index, members, owners)
+        on_path = path_index >= 0
+        congested = num_connections > 1
+        selected = np.zeros(num_satellites, dtype=bool)
+        selected[selected_indices] = True
+        highlighted = np.zeros(num_satellites, dtype=bool)
+        if selected_path is not None:
+            highlighted[paths[selected_path]] = True
+
+        rgba = np.tile(self.WHITE, (num_satellites, 1))
+        rgba[on_path] = self.PATH_COLOURS[path_index[on_path] % len(self.PATH_COLOURS)]
+        rgba[on_path & (congested | flood_colour)] = self.LIGHT_BLUE
+        rgba[selected] = self.RED
+        rgba[highlighted] = self.ORANGE
+        self.rgba = rgba
+
+        # Path colours, flood results share one colour per start satellite
+        if flood_colour:
+            starts = np.array([path[0] for path in paths], dtype=np.int64)
+            colour_index = np.cumsum(np.concatenate(([True], starts[1:] != starts[:-1]))) if len(paths) else starts
+        else:
+            colour_index = np.arange(len(paths))
+        path_rgba = self.PATH_COLOURS[colour_index % len(self.PATH_COLOURS)]
+        if selected_path is not None:
+            path_rgba[selected_path] = self.ORANGE
+
+        same_path = owners[1:] == owners[:-1]
+        self.edges = np.column_stack((members[:-1], members[1:]))[same_path]
+        self.edge_rgba = path_rgba[owners[:-1][same_path]]
+
 class MplCanvas(FigureCanvas):
     def __init__(self):
         fig = Figure(facecolor='black')
@@ -50,15 +142,22 @@ class SpherePlot(QWidget):
         super().__init__()
         self.satellites = satellites
         self.constellation = Constellation()
+        self.constellation.adopt(self.satellites) # Satellites read topology and settings from the constellation's context
+        self.state = self.constellation.state # Arrays backing the satellites, rebuilt when the list changes
         self.paths = PathWidget(self.satellites)
         self.selected_indices = []  # Track selected satellite indices
         self.scatter_plot = None
         self.pause = False  # Pause state
+        self.needs_redraw = True # Set when something other than satellite movement changes the plot
+        self.arc_cache = ArcCache()
+        self.colours = ColourState()
+        self.colours_dirty = True # Set when paths or selections change
+        self.flood_colour = False
+        self.paths.paths_changed.connect(self.request_redraw)
         self.initUI()
         self.update_graph_timer = QtCore.QTimer()
         self.update_graph_timer.timeout.connect(self.update_graph)
         self.start_timer()
-        self.flood_colour = False
 
     def initUI(self):
         main_layout = QHBoxLayout()
@@ -74,13 +173,14 @@ class SpherePlot(QWidget):
         canvas_layout.addWidget(self.canvas)
         
         # Satellite list
-        self.satellite_list = QListWidget()
+        self.satellite_model = SatelliteListModel(self.satellites)
+        self.satellite_list = QListView()
+        self.satellite_list.setUniformItemSizes(True)
+        self.satellite_list.setModel(self.satellite_model)
         self.satellite_list.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
-        for i in range(len(self.satellites)):
-            self.satellite_list.addItem(f"Satellite {i}")
 
         # Connect list selection to handler
-        self.satellite_list.itemSelectionChanged.connect(self.on_satellite_select)
+        self.satellite_list.selectionModel().selectionChanged.connect(self.on_satellite_select)
 
         # Coordinate and Speed editor
         self.editor_widget = CoordinateEditor()
@@ -114,6 +214,8 @@ class SpherePlot(QWidget):
 
         # Add tab for training parameters
         self.train_params = TrainParameters(self.constellation, self.satellites)
+        self.train_params.cancel_requested.connect(self.cancel_training)
+        self.train_worker = None
 
         self.tabs = QTabWidget()
         self.tabs.addTab(self.train_params, "Train")
@@ -174,107 +276,93 @@ class SpherePlot(QWidget):
         self.flood_action = QAction("Flood Route")
         self.flood_action.triggered.connect(self.flood_route)
         train_menu.addAction(self.flood_action)
+        self.cancel_train_action = QAction("Cancel Training")
+        self.cancel_train_action.triggered.connect(self.cancel_training)
+        train_menu.addAction(self.cancel_train_action)
 
         self.train_button = QPushButton("Route Satellites")
         self.train_button.clicked.connect(self.train_init)
         left_layout.addWidget(self.train_button)
 
+        self.init_plot()
         self.plot_points() # Update graph
         self.setLayout(main_layout)
         self.setWindowTitle("Multi-Agent Satellite Routing Simulator")
         self.setGeometry(100, 100, 1000, 600)
         self.show()
 
-    def plot_points(self):
-        self.train_params.update_progress_bar()
-        self.canvas.ax.clear()
-        self.canvas.ax.set_facecolor('black')
-
-        color_order = [COLOUR_GREEN, COLOUR_BLUE, COLOUR_PURPLE, COLOUR_RED]
+    def init_plot(self):
+        # Creates the persistent artists once, plot_points only updates their data
+        ax = self.canvas.ax
+        ax.set_facecolor('black')
+        ax.grid(False)
+        ax.set_axis_off()
+        ax.set_box_aspect([1, 1, 1])
 
-        colors = [COLOUR_WHITE] * len(self.satellites) # Init all as white
+        # Draw a vertical line through the center
+        vertical_line_x = [0, 0]
+        vertical_line_y = [0, 0]
+        vertical_line_z = [-1, 1]
+        ax.plot(vertical_line_x, vertical_line_y, vertical_line_z, color=COLOUR_BLUE_DIM, linewidth=0.5)
 
-        # Plot each satellite's position
-        for n, path in enumerate(self.paths.paths):
-            for i in path:
-                # Color based on path index and color order
-                if(self.flood_colour):
-                    colors[i] = COLOUR_LIGHT_BLUE
-                else:
-                    colors[i] = color_order[n % len(color_order)] if self.satellites[i].num_connections <= 1 else COLOUR_LIGHT_BLUE 
+        # Plot the 2D circle
+        ring_theta = np.linspace(0, 2 * np.pi, 50)
+        ring_radius = 1 # You can adjust the ring_radius accordingly
+        ring_x = ring_radius * np.cos(ring_theta)
+        ring_y = ring_radius * np.sin(ring_theta)
+        ring_z = np.zeros_like(ring_theta)  # The circle lies in the XY plane
+        ax.plot(ring_x, ring_y, ring_z, color=COLOUR_BLUE_DIM, linewidth=0.5)
 
-        for i, sat in enumerate(self.satellites):
-            if i in self.selected_indices:
-                colors[i] = COLOUR_RED
+        self.scatter_plot = ax.scatter([], [], [], s=20, picker=True)
+        self.arc_line, = ax.plot([], [], [], color=COLOUR_BLUE, linestyle='--', linewidth=1) # Arc between the two selected satellites
+        self.path_lines = Line3DCollection([], linestyle='-', linewidth=1) # Arcs of every stored path
+        ax.add_collection(self.path_lines, autolim=False)
+        self.plot_radius = None
 
-            selected_path = self.paths.path_list.selectedIndexes()
-            if(selected_path):
-                current_selection = selected_path[0].row()
-                if i in self.paths.paths[current_selection]:
-                    colors[i] = COLOUR_ORANGE
+    def plot_points(self):
+        # Colours only change with paths or selections, frames in between reuse them
+        if self.colours_dirty or len(self.colours.rgba) != len(self.satellites):
+            self.update_colours()
+            self.scatter_plot.set_color(self.colours.rgba)
+            self.path_lines.set_color(self.colours.edge_rgba)
 
-        coords = np.array([satellite.get_cartesian_coordinates() for satellite in self.satellites])
+        coords = self.state.cartesian()
         x, y, z = coords[:, 0], coords[:, 1], coords[:, 2]
-        self.scatter_plot = self.canvas.ax.scatter(x, y, z, color=colors, s=20, picker=True)
+        self.scatter_plot._offsets3d = (x, y, z)
 
         # Plot great-circle arc if two satellites are selected
         if len(self.selected_indices) == 2:
             sat1 = self.satellites[self.selected_indices[0]]
             sat2 = self.satellites[self.selected_indices[1]]
-            arc_points = self.calculate_great_circle_arc(sat1, sat2)
-            arc_x, arc_y, arc_z = zip(*arc_points)
-            self.canvas.ax.plot(arc_x, arc_y, arc_z, color=COLOUR_BLUE, linestyle='--', linewidth=1) # arcline
-
-        if len(self.paths.paths) > 0:
-            last_start = None
-            colour_index = 0
-
-            for n, path in enumerate(self.paths.paths):
-                if self.flood_colour:
-                    current_start = path[0]
-                    if current_start != last_start:
-                        colour_index += 1
-                        last_start = current_start
-                    # Else, keep the same colour_index
-                else:
-                    colour_index = n
+            arc_x, arc_y, arc_z = self.calculate_great_circle_arc(sat1, sat2).T
+            self.arc_line.set_data_3d(arc_x, arc_y, arc_z)
+            self.arc_line.set_visible(True)
+        else:
+            self.arc_line.set_visible(False)
 
-                selected_path = self.paths.path_list.selectedIndexes()
-                if selected_path:
-                    current_selection = selected_path[0].row() == n
-                    color = color_order[colour_index % len(color_order)] if not current_selection else COLOUR_ORANGE
-                else:
-                    color = color_order[colour_index % len(color_order)]
+        # Arcs for every edge of every path in one batch
+        self.path_lines.set_segments(self.arc_cache.get(self.colours.edges, self.state.longitude, self.state.latitude))
 
-                pairs = [[path[i], path[i + 1]] for i in range(len(path) - 1)]
-                for pair in pairs:
-                    sat1 = self.satellites[pair[0]]
-                    sat2 = self.satellites[pair[1]]
-                    arc_points = self.calculate_great_circle_arc(sat1, sat2)
-                    arc_x, arc_y, arc_z = zip(*arc_points)
-                    self.canvas.ax.plot(arc_x, arc_y, arc_z, color=color, linestyle='-', linewidth=1)  # arcline
+        # Only rescale the axes when satellites move outside the current view
+        radius = max(1, np.linalg.norm(coords, axis=1).max(initial=0))
+        if radius != self.plot_radius:
+            self.canvas.ax.auto_scale_xyz([-radius, radius], [-radius, radius], [-radius, radius], had_data=False)
+            self.plot_radius = radius
 
+        self.needs_redraw = False
+        self.canvas.draw_idle() # Coalesces repeated requests into one redraw
 
+    def request_redraw(self):
+        # Marks the plot as stale so the next timer tick redraws it, even while paused
+        self.needs_redraw = True
+        self.colours_dirty = True
 
-        # Draw a vertical line through the center
-        vertical_line_x = [0, 0]
-        vertical_line_y = [0, 0]
-        vertical_line_z = [-1, 1]
-        self.canvas.ax.plot(vertical_line_x, vertical_line_y, vertical_line_z, color=COLOUR_BLUE_DIM, linewidth=0.5)
-
-        # Plot the 2D circle
-        ring_theta = np.linspace(0, 2 * np.pi, 50)
-        ring_radius = 1 # You can adjust the ring_radius accordingly
-        ring_x = ring_radius * np.cos(ring_theta)
-        ring_y = ring_radius * np.sin(ring_theta)
-        ring_z = np.zeros_like(ring_theta)  # The circle lies in the XY plane
-        self.canvas.ax.plot(ring_x, ring_y, ring_z, color=COLOUR_BLUE_DIM, linewidth=0.5)
-
-        self.canvas.ax.grid(False)
-        self.canvas.ax.set_axis_off()
-        self.canvas.ax.set_box_aspect([1, 1, 1])
-        
-        self.canvas.draw()
+    def update_colours(self):
+        self.colours.update(
+            self.paths.paths, self.state.num_connections, self.selected_indices,
+            self.paths.selected_row(), self.flood_colour
+        )
+        self.colours_dirty = False
 
     def pause_timer(self):
         # Pauses the update graph timer.
@@ -294,15 +382,18 @@ class SpherePlot(QWidget):
             self.satellite_list.clearSelection()
             self.selected_indices = selection # Update selection in graph view
             for i in self.selected_indices: # Update selection in list view
-                self.satellite_list.item(i).setSelected(True)
+                self.select_satellite(i)
         else:
             selection = int(indices[0])
             self.satellite_list.clearSelection()
             self.selected_indices = [selection] # Update selection in graph view
-            self.satellite_list.item(selection).setSelected(True) # Update selection in list view
+            self.select_satellite(selection) # Update selection in list view
+
+    def select_satellite(self, index):
+        self.satellite_list.selectionModel().select(self.satellite_model.index(index), QItemSelectionModel.Select)
 
     def on_satellite_select(self):
-        self.selected_indices = [index.row() for index in self.satellite_list.selectedIndexes()]
+        self.selected_indices = [index.row() for index in self.satellite_list.selectionModel().selectedIndexes()]
         if len(self.selected_indices) == 2:
             pass
         else:
@@ -311,6 +402,7 @@ class SpherePlot(QWidget):
             if len(self.selected_indices) == 1:
                 satellite = self.satellites[self.selected_indices[0]]
                 self.editor_widget.set_sliders(satellite.longitude, satellite.latitude, satellite.height, satellite.speed)
+        self.colours_dirty = True
         self.plot_points()
 
     def on_path_select(self):
@@ -326,23 +418,12 @@ class SpherePlot(QWidget):
             self.plot_points()
 
     def calculate_great_circle_arc(self, sat1, sat2, num_points=50):
-        # Convert lat/lon to radians
-        lat1, lon1 = np.radians([sat1.latitude, sat1.longitude])
-        lat2, lon2 = np.radians([sat2.latitude, sat2.longitude])
-
-        # Calculate the angle between the two points
-        d = np.arccos(np.sin(lat1) * np.sin(lat2) + np.cos(lat1) * np.cos(lat2) * np.cos(lon2 - lon1))
-
-        # Calculate points along the great circle
-        arc_points = []
-        for t in np.linspace(0, 1, num_points):
-            A = np.sin((1 - t) * d) / np.sin(d)
-            B = np.sin(t * d) / np.sin(d)
-            x = A * np.cos(lat1) * np.cos(lon1) + B * np.cos(lat2) * np.cos(lon2)
-            y = A * np.cos(lat1) * np.sin(lon1) + B * np.cos(lat2) * np.sin(lon2)
-            z = A * np.sin(lat1) + B * np.sin(lat2)
-            arc_points.append((x, y, z))
-        return arc_points
+        # Points along the great circle between two satellites, shape (num_points, 3)
+        return great_circle_arcs(
+            np.array([sat1.longitude]), np.array([sat1.latitude]),
+            np.array([sat2.longitude]), np.array([sat2.latitude]),
+            num_points
+        )[0]
 
     def add_satellite(self):
         longitude = np.random.uniform(0, 360)
@@ -351,37 +432,37 @@ class SpherePlot(QWidget):
         speed = 0.5
         new_satellite = Satellite(longitude, latitude, height, speed)
         self.satellites.append(new_satellite)
-        self.satellite_list.addItem(f"Satellite {len(self.satellites) - 1}")
+        self.state = ConstellationState.of(self.satellites)
+        self.satellite_model.append()
         self.plot_points()
 
     def delete_satellite(self):
         if self.selected_indices:
             for index in sorted(self.selected_indices, reverse=True):
                 del self.satellites[index]
-                self.satellite_list.takeItem(index)
+            self.state = ConstellationState.of(self.satellites)
             self.selected_indices = []
             self.plot_points()
             self.update_satellite_list()
 
     def update_satellite_list(self):
-        self.satellite_list.clear()
-        for i in range(len(self.satellites)):
-            self.satellite_list.addItem(f"Satellite {i}")
+        # Satellites are named by index, so every row after a deleted one changes
+        self.satellite_model.reset()
 
     def toggle_pause(self, checked):
+        # The timer keeps running while paused, update_graph skips redraws until something changes
         self.pause = checked
         if self.pause:
             self.pause_button.setText("Pause")
-            self.pause_timer()
         else:
             self.pause_button.setText("Resume")
-            self.start_timer()
 
     def update_graph(self):
-        if not self.pause:
-            for satellite in self.satellites:
-                satellite.update_position()
-        self.plot_points()
+        moved = not self.pause and self.state.speed.any()
+        if moved:
+            self.state.step()
+        if moved or self.needs_redraw:
+            self.plot_points()
         if len(self.selected_indices) == 2:
             # Update the distance label if two satellites are selected
             sat1 = self.satellites[self.selected_indices[0]]
@@ -393,89 +474,27 @@ class SpherePlot(QWidget):
 
 
     def distribute_grid(self):
-        # Grid Distribution
-        n = len(self.satellites)
-        num_latitudes = int(np.sqrt(n))
-        num_longitudes = int(np.sqrt(n))
-
-        latitudes = np.linspace(-90, 90, num_latitudes)
-        longitudes = np.linspace(0, 360, num_longitudes, endpoint=False)
-        i = 0
-        for lat in latitudes:
-            for lon in longitudes:
-                if i < n:
-                    self.satellites[i].latitude = lat
-                    self.satellites[i].longitude = lon
-                    i += 1
+        distributions.grid(self.state.longitude, self.state.latitude)
         self.plot_points()
 
     def distribute_spiral(self):
-        # Golden Ratio Distribution
-        n = len(self.satellites)
-        if n < 2:
-            return
-        golden_angle = np.pi * (3 - np.sqrt(5))  # Approximate golden angle in radians
-        for i in range(len(self.satellites)):
-            self.satellites[i].latitude = np.degrees(np.arcsin(-1 + 2 * i / (n - 1)))  # Distribute latitude evenly between -90 and 90
-            self.satellites[i].longitude = np.degrees((i * golden_angle) % (2 * np.pi))  # Distribute longitude based on golden angle
+        distributions.spiral(self.state.longitude, self.state.latitude)
         self.plot_points()
 
     def distribute_ring(self):
-        n = len(self.satellites)
-        latitude = 0  # All satellites are on the equatorial plane
-        longitudes = np.linspace(0, 360, n, endpoint=False)  # Evenly spaced longitudes around the ring
-
-        for i in range(n):
-            self.satellites[i].latitude = latitude
-            self.satellites[i].longitude = longitudes[i]
+        distributions.ring(self.state.longitude, self.state.latitude)
         self.plot_points()
 
     def distribute_random(self):
-        for i in range(len(self.satellites)):
-            self.satellites[i].latitude = np.random.uniform(-90, 90)
-            self.satellites[i].longitude = np.random.uniform(0, 360)
+        distributions.random(self.state.longitude, self.state.latitude)
         self.plot_points()
 
     def distribute_split(self):
-        n = len(self.satellites)
-        half_n = n // 2
-
-        if(n < 2):
-            return
-        
-        # Top hemisphere distribution
-        for i in range(half_n):
-            latitude = np.random.uniform(35, 90)  # Random latitude between 0 and 90 (top hemisphere)
-            longitude = np.linspace(0, 360, half_n, endpoint=False)[i % half_n]  # Evenly spaced longitudes
-            self.satellites[i].latitude = latitude
-            self.satellites[i].longitude = longitude
-        
-        # Bottom hemisphere distribution
-        for i in range(half_n, n):
-            latitude = np.random.uniform(-90, -35)  # Random latitude between -90 and 0 (bottom hemisphere)
-            longitude = np.linspace(0, 360, half_n, endpoint=False)[i % half_n]  # Evenly spaced longitudes
-            self.satellites[i].latitude = latitude
-            self.satellites[i].longitude = longitude
+        distributions.split(self.state.longitude, self.state.latitude)
         self.plot_points()
 
     def distribute_cluster(self):
-        n = len(self.satellites)
-        # Clustered distribution
-        num_clusters = 5  # Number of clusters
-
-        if n < num_clusters: # Handle edge case
-            num_clusters = n
-
-        satellites_per_cluster = n // num_clusters
-        cluster_centers = [(np.random.uniform(-90, 90), np.random.uniform(0, 360)) for _ in range(num_clusters)]
-        
-        for i in range(n):
-            cluster_idx = i // satellites_per_cluster
-            center_lat, center_lon = cluster_centers[cluster_idx % num_clusters]
-            latitude = np.random.normal(center_lat, 5)  # Cluster around the center latitude with some variance
-            longitude = (np.random.normal(center_lon, 10)) % 360  # Cluster around the center longitude with some variance
-            self.satellites[i].latitude = np.clip(latitude, -90, 90)  # Ensure latitude stays within bounds
-            self.satellites[i].longitude = longitude
+        distributions.cluster(self.state.longitude, self.state.latitude)
         self.plot_points()
 
     def set_uniform_speed(self):
@@ -486,28 +505,33 @@ class SpherePlot(QWidget):
         for i in range(len(self.satellites)):
             self.satellites[i].speed = np.random.uniform(0.5, 1)
 
-    def get_train_results(self):
-        results = self.train_worker.results.get()
-        self.paths.add_path([sat.index for sat in results])
+    def get_train_results(self, path):
+        self.paths.add_path(path)
+
+    def train_done(self):
+        self.train_worker.deleteLater()
+        self.train_worker = None
 
     def train_multithread(self, start_index, end_index):
         # Runs training on its own process to not slow down other operations
-        self.train_thread = QThread()
         self.train_worker = TrainProcess(self.constellation, self.satellites, start_index, end_index)
-        self.train_worker.moveToThread(self.train_thread)
-
-        self.train_thread.started.connect(self.train_worker.run)
-        self.train_worker.finished.connect(self.train_thread.quit)  # End the thread after completion
-        self.train_worker.finished.connect(self.get_train_results)
-        self.train_worker.finished.connect(self.train_worker.deleteLater)
-        self.train_thread.finished.connect(self.train_thread.deleteLater)
+        self.train_worker.progress.connect(self.train_params.set_progress)
+        self.train_worker.result.connect(self.get_train_results)
+        self.train_worker.failed.connect(lambda message: print("error", message))
+        self.train_worker.finished.connect(self.train_done)
 
         # Start training
-        self.train_thread.start()
+        self.train_worker.start()
+
+    def cancel_training(self):
+        if self.train_worker is not None:
+            self.train_worker.cancel()
 
     def train_init(self):
         if len(self.selected_indices) != 2:
             return
+        if self.train_worker is not None: # Only one training process at a time
+            return
         
         sat1 = self.selected_indices[0]
         sat2 = self.selected_indices[1]
@@ -524,14 +548,17 @@ class SpherePlot(QWidget):
         flood_map = self.constellation.flood(self.satellites, sat1, sat2)
         # self.paths.add_path(flood_map)
         self.flood_colour = True
-        for pair in flood_map:
-            self.paths.add_path([sat.index for sat in pair])
+        self.paths.add_paths([[sat1.index, sat2.index] for sat1, sat2 in flood_map], group=True) # One flood is added and deleted as a whole
 
 
 class TrainProcess(QObject):
-    finished = pyqtSignal()
-    progress = pyqtSignal(str)  # Emit progress updates
-    results = Queue()
+    # Trains in a separate process on a snapshot of the satellites, messages are polled from a pipe on the GUI thread
+    POLL_INTERVAL = 50
+
+    finished = pyqtSignal() # Emitted once the process is done, whatever the outcome
+    progress = pyqtSignal(int, list, dict)  # Iteration count, current best path, metrics
+    result = pyqtSignal(list) # Optimal path as satellite indices
+    failed = pyqtSignal(str)
 
     def __init__(self, constellation, satellites, start_index, end_index):
         super().__init__()
@@ -539,15 +566,54 @@ class TrainProcess(QObject):
         self.satellites = satellites
         self.start_index = start_index
         self.end_index = end_index
-
-    def run(self):
-        # Run train function in the background
-        self.constellation.train_wrapper(self.satellites, self.start_index, self.end_index, self.results)
+        self.process = None
+        self.poll_timer = QtCore.QTimer()
+        self.poll_timer.timeout.connect(self.poll)
+
+    def start(self):
+        arrays = self.constellation.snapshot(self.satellites, matrices=False)
+        settings = self.constellation.get_settings()
+        self.connection, child_connection = Pipe(duplex=False)
+        self.cancel_event = Event()
+        self.process = Process(
+            target=train_process,
+            args=(arrays, settings, self.start_index, self.end_index, child_connection, self.cancel_event),
+            daemon=True
+        )
+        self.process.start()
+        child_connection.close() # Only the child writes, so recv raises EOFError if it dies
+        self.poll_timer.start(self.POLL_INTERVAL)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def poll(self):
+        try:
+            while self.connection.poll():
+                message = self.connection.recv()
+                if message[0] == 'progress':
+                    self.progress.emit(message[1], message[2], message[3])
+                else:
+                    if message[0] == 'result':
+                        self.result.emit(message[1])
+                    elif message[0] == 'error':
+                        self.failed.emit(message[1])
+                    self.stop()
+                    return
+        except EOFError:
+            self.failed.emit("Training process exited unexpectedly")
+            self.stop()
+
+    def stop(self):
+        self.poll_timer.stop()
+        self.connection.close()
+        self.process.join()
         self.finished.emit()
 
 class TrainParameters(QWidget):
     # Signal emitted when a parameter changes
     parameter_changed = pyqtSignal(str, object)
+    cancel_requested = pyqtSignal()
 
     def __init__(self, constellation, satellites):
         super().__init__()
@@ -555,6 +621,7 @@ class TrainParameters(QWidget):
         self.constellation = constellation
         self.satellites = satellites
 
+        # Values to reset to, edits only change this constellation and its context
         self.defaults = {
             'MAX_ITERATIONS': self.constellation.MAX_ITERATIONS,
             'ALPHA': Satellite.ALPHA,
@@ -642,6 +709,10 @@ class TrainParameters(QWidget):
         self.reset_button.clicked.connect(self.reset_defaults)
         button_layout.addWidget(self.reset_button)
 
+        self.cancel_button = QPushButton("Cancel Training")
+        self.cancel_button.clicked.connect(lambda: self.cancel_requested.emit())
+        button_layout.addWidget(self.cancel_button)
+
 
         # Progress bar
         self.progress_bar = QProgressBar()
@@ -649,6 +720,16 @@ class TrainParameters(QWidget):
         self.progress_bar.setValue(self.constellation.iteration_count)
         main_layout.addWidget(self.progress_bar)
 
+        # Best path found so far by the running training
+        self.best_path_label = QLabel("Best path: N/A")
+        self.best_path_label.setWordWrap(True)
+        main_layout.addWidget(self.best_path_label)
+
+        # Counters of the running training, see metrics.Metrics
+        self.metrics_label = QLabel("")
+        self.metrics_label.setWordWrap(True)
+        main_layout.addWidget(self.metrics_label)
+
         self.reset_defaults()
 
         main_layout.addLayout(button_layout)
@@ -661,44 +742,50 @@ class TrainParameters(QWidget):
         self.parameter_changed.emit("max_iterations", value)
 
     def update_alpha(self, value):
-        Satellite.ALPHA = value
+        self.constellation.context.ALPHA = value
         self.parameter_changed.emit("ALPHA", value)
 
     def update_gamma(self, value):
-        Satellite.GAMMA = value
+        self.constellation.context.GAMMA = value
         self.parameter_changed.emit("GAMMA", value)
 
     def update_epsilon(self, value):
-        Satellite.EPSILON = value
+        self.constellation.context.EPSILON = value
         self.parameter_changed.emit("EPSILON", value)
 
     def update_delay_low(self, value):
-        Satellite.DELAY_LOW = value
+        self.constellation.context.DELAY_LOW = value
         self.parameter_changed.emit("DELAY_LOW", value)
 
     def update_delay_medium(self, value):
-        Satellite.DELAY_MEDIUM = value
+        self.constellation.context.DELAY_MEDIUM = value
         self.parameter_changed.emit("DELAY_MEDIUM", value)
 
     def update_delay_high(self, value):
-        Satellite.DELAY_HIGH = value
+        self.constellation.context.DELAY_HIGH = value
         self.parameter_changed.emit("DELAY_HIGH", value)
 
     def update_congestion_low(self, value):
-        Satellite.CONGESTION_LOW = value
+        self.constellation.context.CONGESTION_LOW = value
         self.parameter_changed.emit("CONGESTION_LOW", value)
 
     def update_congestion_medium(self, value):
-        Satellite.CONGESTION_MEDIUM = value
+        self.constellation.context.CONGESTION_MEDIUM = value
         self.parameter_changed.emit("CONGESTION_MEDIUM", value)
 
     def update_congestion_high(self, value):
-        Satellite.CONGESTION_HIGH = value
+        self.constellation.context.CONGESTION_HIGH = value
         self.parameter_changed.emit("CONGESTION_HIGH", value)
 
-    def update_progress_bar(self):
-        # Updates the progress bar and label
-        self.progress_bar.setValue(self.constellation.iteration_count)
+    def set_progress(self, iteration, best_path, metrics):
+        # Updates the progress bar and labels from the training process
+        self.progress_bar.setValue(iteration)
+        self.best_path_label.setText(f"Best path: {best_path if best_path else 'N/A'}")
+        self.metrics_label.setText(
+            f"Steps per episode: {metrics['mean_episode_steps']:.1f} (max {metrics['max_episode_steps']})\n"
+            f"Max steps aborts: {metrics['max_steps_aborts']}, dead ends: {metrics['dead_ends']}\n"
+            f"Q-values: {metrics['q_size']}, training time: {metrics['phase_seconds'].get('training', 0):.1f}s"
+        )
 
     # Reset to default values
     def reset_defaults(self):
@@ -713,15 +800,94 @@ class TrainParameters(QWidget):
         self.congestion_medium_spinbox.setValue(self.defaults['CONGESTION_MEDIUM'])
         self.congestion_high_spinbox.setValue(self.defaults['CONGESTION_HIGH'])
 
-from PyQt5.QtWidgets import QWidget, QFormLayout, QListWidget, QPushButton, QAbstractItemView, QMessageBox
+from PyQt5.QtWidgets import QWidget, QFormLayout, QListView, QPushButton, QAbstractItemView, QMessageBox
 from PyQt5.QtCore import Qt
 
 
-class PathWidget(QWidget):
+class SatelliteListModel(QAbstractListModel):
+    # Rows of the satellite list, item text is only formatted for the rows the view shows
 
     def __init__(self, satellites):
+        super().__init__()
+        self.satellites = satellites
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.satellites)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return f"Satellite {index.row()}"
+        return None
+
+    def append(self):
+        # Call after a satellite was appended to the list
+        row = len(self.satellites) - 1
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.endInsertRows()
+
+    def reset(self):
+        self.beginResetModel()
+        self.endResetModel()
+
+class PathListModel(QAbstractListModel):
+    # Rows of the path list, paths are added in groups (a flood result is one group) and each group is deleted as a whole
+
+    def __init__(self):
         super().__init__()
         self.paths = []
+        self.groups = [] # Group of each path, paths of a group are consecutive
+        self.next_group = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            # Represent the path as its length and satellites
+            path = self.paths[index.row()]
+            return f"(%d): %s" % (len(path), path)
+        return None
+
+    def add_paths(self, paths, group=False):
+        # Appends paths in one insertion, as a single group or as one group each
+        first = len(self.paths)
+        self.beginInsertRows(QModelIndex(), first, first + len(paths) - 1)
+        self.paths.extend(paths)
+        if group:
+            self.groups.extend([self.next_group] * len(paths))
+            self.next_group += 1
+        else:
+            self.groups.extend(range(self.next_group, self.next_group + len(paths)))
+            self.next_group += len(paths)
+        self.endInsertRows()
+
+    def group_rows(self, row):
+        # First and last row of the group row belongs to
+        group = self.groups[row]
+        first = row
+        while first > 0 and self.groups[first - 1] == group:
+            first -= 1
+        last = row
+        while last + 1 < len(self.groups) and self.groups[last + 1] == group:
+            last += 1
+        return first, last
+
+    def remove_rows(self, first, last):
+        # Removes rows first..last in one go, returns the removed paths
+        self.beginRemoveRows(QModelIndex(), first, last)
+        removed = self.paths[first:last + 1]
+        del self.paths[first:last + 1]
+        del self.groups[first:last + 1]
+        self.endRemoveRows()
+        return removed
+
+class PathWidget(QWidget):
+    paths_changed = QtCore.pyqtSignal() # Emitted when paths are added, removed or selected
+
+    def __init__(self, satellites):
+        super().__init__()
+        self.model = PathListModel()
+        self.paths = self.model.paths
         self.satellites = satellites
         self.initUI()
 
@@ -729,9 +895,11 @@ class PathWidget(QWidget):
         layout = QFormLayout()
         
         # Path list
-        self.path_list = QListWidget()
+        self.path_list = QListView()
+        self.path_list.setUniformItemSizes(True)
+        self.path_list.setModel(self.model)
         self.path_list.setSelectionMode(QAbstractItemView.SingleSelection)
-        self.path_list.itemSelectionChanged.connect(self.on_path_select)
+        self.path_list.selectionModel().selectionChanged.connect(self.on_path_select)
         layout.addWidget(self.path_list)
 
         # Delete button
@@ -744,45 +912,40 @@ class PathWidget(QWidget):
     def add_path(self, new_path):
         if not new_path:
             return
-        
-        # Assuming new_path is a list of objects
-        start = new_path[0]
-        end = new_path[-1]
-
-        for i in new_path:
-            if(type(i) == list):
-                pass
-            else:
+        self.add_paths([new_path])
+
+    def add_paths(self, new_paths, group=False):
+        # Adds many paths with one list update and one redraw, group makes them a single deletable group
+        new_paths = [path for path in new_paths if path]
+        if not new_paths:
+            return
+
+        for path in new_paths:
+            for i in path:
                 self.satellites[i].num_connections += 1
 
-        # Represent the path as a range (first object's index -> last object's index)
-        path_range = f"(%d): %s" % (len(new_path), new_path)
-        
-        # Append the path to the list and update the display
-        self.paths.append(new_path)
-        self.path_list.addItem(path_range)
+        self.model.add_paths(new_paths, group)
+        self.paths_changed.emit()
+
+    def selected_row(self):
+        selected = self.path_list.selectionModel().selectedRows()
+        return selected[0].row() if selected else None
 
     def delete_path(self):
-        selected = self.path_list.selectedIndexes()
-        
-        if not selected:
+        row = self.selected_row()
+        if row is None:
             return
-        
-        # Iterate through selected items and remove them from paths
-        for row in selected:
-            index = row.row()
-            
+
+        # Delete the selected path along with the rest of its group
+        first, last = self.model.group_rows(row)
+        for path in self.model.remove_rows(first, last):
             # Delete the connection from the satellites
-            for sat in self.paths[index]:
+            for sat in path:
                 self.satellites[sat].num_connections -= 1
-            
-            # Delete path
-            del self.paths[index]
-            self.path_list.takeItem(index)
+        self.paths_changed.emit()
 
     def on_path_select(self):
-        pass
-
+        self.paths_changed.emit()
 
 
 class CoordinateEditor(QWidget):
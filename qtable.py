@@ -0,0 +1,250 @@
+import numpy as np
+from satellite import Satellite
+from topology import arc_distance, distance_block, latency_levels, neighbour_table
+
+class QTable:
+    # Dense Q-values for every satellite agent, indexed by [agent, state_code, action_index]
+    # The action index is the index of the next-hop satellite in the constellation
+
+    def __init__(self, num_agents, num_states=Satellite.NUM_STATES, num_actions=None):
+        if num_actions is None: # Any satellite can be an action
+            num_actions = num_agents
+        self.values = np.zeros((num_agents, num_states, num_actions))
+
+    @classmethod
+    def from_satellites(cls, satellites):
+        # Copies the dict-backed Q-values of each satellite into a new table
+        table = cls(len(satellites))
+        for sat in satellites:
+            if isinstance(sat.Q, dict):
+                for (state, action), value in sat.Q.items():
+                    table.values[sat.index, state, action.index] = value
+            else:
+                table.values[sat.index] = sat.Q
+        return table
+
+    def attach(self, satellites):
+        # Points each satellite's Q at its own slice of the table (a view, no copy)
+        for sat in satellites:
+            sat.Q = self.values[sat.index]
+
+    def reset(self):
+        self.values.fill(0)
+
+    def snapshot(self):
+        return self.values.copy()
+
+    def best_actions(self):
+        # Greedy next hop for every (agent, state) pair
+        return np.argmax(self.values, axis=2)
+
+    def save(self, path):
+        np.save(path, self.values)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        values = np.load(path, mmap_mode=mmap_mode)
+        table = cls.__new__(cls)
+        table.values = values
+        return table
+
+class NeighbourQTable:
+    # Q-values for every satellite agent, indexed by [agent, state_code, neighbour slot]
+    # The neighbour slot is the column of the next hop in the padded neighbour table (topology.neighbour_table),
+    # so memory grows with N × max degree rather than N × N, used by the batched trainer
+
+    def __init__(self, neighbours, valid, linked, num_states=Satellite.NUM_STATES):
+        self.neighbours = neighbours
+        self.valid = valid # Slots that can be chosen, linked and available
+        self.linked = linked # Slots holding a neighbour, padding is False
+        self.values = np.zeros((neighbours.shape[0], num_states, neighbours.shape[1]))
+
+    @classmethod
+    def from_satellites(cls, satellites, indptr, indices, available):
+        # Table over the neighbour index, starting from the values the satellites already learned for their neighbours
+        neighbours, valid = neighbour_table(indptr, indices, available)
+        linked = np.arange(neighbours.shape[1])[np.newaxis, :] < np.diff(indptr)[:, np.newaxis]
+        table = cls(neighbours, valid, linked)
+        for sat in satellites:
+            row = sat.index
+            if isinstance(sat.Q, dict):
+                if not sat.Q:
+                    continue
+                slots = {int(a): slot for slot, a in enumerate(neighbours[row, linked[row]].tolist())}
+                for (state, action), value in sat.Q.items():
+                    slot = slots.get(action.index)
+                    if slot is not None: # Links that no longer exist are left out
+                        table.values[row, state, slot] = value
+            else:
+                table.values[row][:, linked[row]] = sat.Q[:, neighbours[row, linked[row]]]
+        return table
+
+    def to_satellites(self, satellites):
+        # Writes the learned values back into each satellite's Q, whichever backend it uses
+        for sat in satellites:
+            if not isinstance(sat.Q, dict):
+                row = sat.index
+                sat.Q[:, self.neighbours[row, self.linked[row]]] = self.values[row][:, self.linked[row]]
+        agents, states, slots = np.nonzero(self.values)
+        keep = self.linked[agents, slots] # Padding never holds values, but skip it anyway
+        agents, states, slots = agents[keep], states[keep], slots[keep]
+        actions = self.neighbours[agents, slots]
+        for agent, state, slot, action in zip(agents.tolist(), states.tolist(), slots.tolist(), actions.tolist()):
+            sat = satellites[agent]
+            if isinstance(sat.Q, dict):
+                sat.Q[(state, satellites[action])] = self.values[agent, state, slot]
+
+    def greedy_path(self, start_index, end_index, states):
+        # Follows the highest Q-value valid slot like Constellation.greedy_path, states holds each satellite's state code
+        # Returns the path as indices and the sum of Q-values along it, like Constellation.path_value
+        path = [start_index]
+        visited = {start_index}
+        value = 0
+        while path[-1] != end_index:
+            row = path[-1]
+            if not self.valid[row].any():
+                break
+            q_values = self.values[row, states[row]]
+            slot = int(np.argmax(np.where(self.valid[row], q_values, -np.inf)))
+            next_index = int(self.neighbours[row, slot])
+            if next_index in visited: # Policy loops back on itself
+                break
+            value += q_values[slot]
+            visited.add(next_index)
+            path.append(next_index)
+        return path, value
+
+class DestinationQTable:
+    # Q-values learned separately for each destination, indexed by [destination slot, agent, neighbour slot]
+    # The neighbour slot is the column of the next hop in the padded neighbour table (topology.neighbour_table)
+    # Values are float32, the table grows with destinations × N × max degree
+    DTYPE = np.float32
+
+    def __init__(self, destinations, neighbours, valid):
+        self.destinations = np.asarray(destinations)
+        self.slots = {destination: slot for slot, destination in enumerate(self.destinations.tolist())}
+        self.neighbours = neighbours
+        self.valid = valid
+        self.values = np.zeros((len(self.destinations),) + neighbours.shape, dtype=self.DTYPE)
+
+    @classmethod
+    def nbytes(cls, num_destinations, shape):
+        # Size of the values for num_destinations over a neighbour table of the given shape
+        return num_destinations * int(np.prod(shape)) * np.dtype(cls.DTYPE).itemsize
+
+    def state_codes(self, state):
+        # State code of every satellite towards every destination, shape (destinations, agents), same as Satellite.get_state
+        distances = distance_block(
+            state.longitude[self.destinations], state.latitude[self.destinations], state.height[self.destinations],
+            state.longitude, state.latitude, state.height,
+            state.context.EARTH_RADIUS
+        )
+        delay = latency_levels(distances, state.context.DELAY_LOW, state.context.DELAY_MEDIUM)
+        congestion = np.full(len(state), Satellite.HIGH, dtype=np.uint8)
+        congestion[state.num_connections <= state.context.CONGESTION_MEDIUM] = Satellite.MEDIUM
+        congestion[state.num_connections <= state.context.CONGESTION_LOW] = Satellite.LOW
+        return delay * len(Satellite.LEVELS) + congestion
+
+    def best_slots(self):
+        return np.argmax(np.where(self.valid, self.values, -np.inf), axis=2)
+
+    def next_hops(self):
+        # Greedy next hop from every satellite towards every destination, -1 where there is none
+        hops = self.neighbours[np.arange(self.neighbours.shape[0]), self.best_slots()]
+        return np.where(self.valid.any(axis=1), hops, -1)
+
+    def path(self, start_index, end_index):
+        # Follows the greedy next hops towards end_index, stops on a dead end or when the policy loops
+        next_hops = self.values[self.slots[end_index]]
+        path = [start_index]
+        visited = {start_index}
+        while path[-1] != end_index:
+            row = path[-1]
+            if not self.valid[row].any():
+                break
+            slot = int(np.argmax(np.where(self.valid[row], next_hops[row], -np.inf)))
+            next_index = int(self.neighbours[row, slot])
+            if next_index in visited:
+                break
+            visited.add(next_index)
+            path.append(next_index)
+        return path
+
+class QStore:
+    # Learned Q-values with the geometry and thresholds they were learned for, saved to a compact npz file
+    # Entries are (agent, state, action, value) with agent and action as satellite indices, so they don't depend on objects
+    MAX_DRIFT = 2 # Max degrees a satellite may have moved relative to the constellation for its values to be reused
+    THRESHOLDS = ('EARTH_RADIUS', 'DELAY_LOW', 'DELAY_MEDIUM', 'DELAY_HIGH', 'CONGESTION_LOW', 'CONGESTION_MEDIUM', 'CONGESTION_HIGH')
+
+    def __init__(self, agents, states, actions, values, longitude, latitude, height, thresholds):
+        self.agents = agents
+        self.states = states
+        self.actions = actions
+        self.values = values
+        self.longitude = longitude
+        self.latitude = latitude
+        self.height = height
+        self.thresholds = thresholds
+
+    @classmethod
+    def from_satellites(cls, satellites, state):
+        # Collects the non-zero Q-values of either backend, state holds the satellites' positions and its context the thresholds
+        agents, states, actions, values = [], [], [], []
+        for sat in satellites:
+            if isinstance(sat.Q, dict):
+                for (s, action), value in sat.Q.items():
+                    agents.append(sat.index)
+                    states.append(s)
+                    actions.append(action.index)
+                    values.append(value)
+            else:
+                s, action = np.nonzero(sat.Q)
+                agents.extend([sat.index] * len(s))
+                states.extend(s.tolist())
+                actions.extend(action.tolist())
+                values.extend(sat.Q[s, action].tolist())
+        return cls(
+            np.array(agents, dtype=np.int32), np.array(states, dtype=np.uint8),
+            np.array(actions, dtype=np.int32), np.array(values, dtype=float),
+            state.longitude.copy(), state.latitude.copy(), state.height.copy(),
+            np.array([getattr(state.context, name) for name in cls.THRESHOLDS], dtype=float)
+        )
+
+    def drift(self, state):
+        # Largest angle (degrees) any satellite moved, after removing the rotation the whole constellation made
+        rotation = np.median((state.longitude - self.longitude + 180) % 360 - 180)
+        return float(np.max(arc_distance(
+            self.longitude + rotation, self.latitude, 0, state.longitude, state.latitude, 0, np.degrees(1)
+        ), initial=0))
+
+    def compatible(self, state):
+        # Values can be reused for the same satellites and thresholds, with positions within MAX_DRIFT
+        current = np.array([getattr(state.context, name) for name in self.THRESHOLDS], dtype=float)
+        return (len(state) == len(self.longitude) and np.array_equal(current, self.thresholds)
+                and np.allclose(state.height, self.height) and self.drift(state) <= self.MAX_DRIFT)
+
+    def to_table(self):
+        table = QTable(len(self.longitude))
+        table.values[self.agents, self.states, self.actions] = self.values
+        return table
+
+    def to_dicts(self, satellites):
+        # Replaces each satellite's Q with a dict holding its stored values
+        for sat in satellites:
+            sat.Q = {}
+        for agent, s, action, value in zip(self.agents.tolist(), self.states.tolist(), self.actions.tolist(), self.values.tolist()):
+            satellites[agent].Q[(s, satellites[action])] = value
+
+    def save(self, path):
+        np.savez(
+            path, agents=self.agents, states=self.states, actions=self.actions, values=self.values,
+            longitude=self.longitude, latitude=self.latitude, height=self.height, thresholds=self.thresholds
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(
+                arrays['agents'], arrays['states'], arrays['actions'], arrays['values'],
+                arrays['longitude'], arrays['latitude'], arrays['height'], arrays['thresholds']
+            )
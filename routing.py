@@ -0,0 +1,167 @@
+import heapq
+import numpy as np
+from topology import compute_sparse_adjacency, arc_distance
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import shortest_path
+except ImportError: # Optional, RoutingTable.build falls back to Floyd-Warshall without it
+    shortest_path = None
+
+def propagate_longitudes(longitudes, speeds, ticks):
+    # Longitude of every satellite at ticks 0..ticks-1, shape (ticks, N), wrapped like Satellite.update_position
+    steps = np.arange(ticks)[:, np.newaxis]
+    return (np.asarray(longitudes, dtype=float)[np.newaxis, :] + steps * np.asarray(speeds, dtype=float)[np.newaxis, :]) % 360
+
+def time_expanded_adjacency(longitudes, latitudes, heights, earth_radius, delay_high=0):
+    # Neighbour index (indptr, indices, distances) of every tick, one row of longitudes per tick
+    return [
+        compute_sparse_adjacency(tick_longitudes, latitudes, heights, earth_radius=earth_radius, delay_high=delay_high)
+        for tick_longitudes in longitudes
+    ]
+
+def csr_neighbours(indptr, indices, rows):
+    # Neighbours of all the given rows at once, returned as (source row, neighbour) pairs
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    sources = np.repeat(rows, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return sources, indices[np.repeat(starts, counts) + offsets]
+
+def earliest_arrival(adjacency, available, start_index, end_index):
+    # Breadth-first search over (satellite, tick) nodes: every tick a satellite holding the packet either keeps it
+    # or hands it to a neighbour visible during that tick, which receives it on the next tick
+    # Returns [(index, tick), ...] where tick is when that satellite forwards the packet (for the last one, when it
+    # arrives), or [] if the end satellite can't be reached within the ticks in adjacency
+    num_satellites = len(available)
+    arrival = np.full(num_satellites, -1, dtype=np.int64) # Tick each satellite first holds the packet
+    parent = np.full(num_satellites, -1, dtype=np.int64)
+    arrival[start_index] = 0
+
+    tick = 0
+    while arrival[end_index] < 0 and tick < len(adjacency):
+        indptr, indices, _ = adjacency[tick]
+        holding = np.nonzero(arrival >= 0)[0]
+        sources, targets = csr_neighbours(indptr, indices, holding)
+
+        # Relays have to accept connections, like Satellite.get_possible_actions
+        new = available[targets] & (arrival[targets] < 0)
+        targets, first = np.unique(targets[new], return_index=True)
+        arrival[targets] = tick + 1
+        parent[targets] = sources[new][first]
+        tick += 1
+
+    if arrival[end_index] < 0:
+        return []
+
+    path = [(end_index, int(arrival[end_index]))]
+    while path[-1][0] != start_index:
+        index = path[-1][0]
+        path.append((int(parent[index]), int(arrival[index]) - 1)) # Forwarded the tick before the next satellite got it
+    return path[::-1]
+
+def shortest_path_tree(indptr, indices, distances, available, start_index, end_index=None, heuristic=None):
+    # Heap-based Dijkstra over the neighbour index, relays have to be available like in Satellite.get_possible_actions
+    # Returns (distance, parent) arrays, unreached satellites have an infinite distance and parent -1
+    # With end_index set the search stops once it is settled (distances of unsettled satellites are then only upper
+    # bounds), heuristic (a lower bound on the distance left from each satellite) turns it into A*
+    num_satellites = len(available)
+    distance = np.full(num_satellites, np.inf)
+    parent = np.full(num_satellites, -1, dtype=np.int64)
+    settled = np.zeros(num_satellites, dtype=bool)
+    distance[start_index] = 0
+    if heuristic is not None:
+        heuristic = np.asarray(heuristic)
+
+    heap = [(heuristic[start_index] if heuristic is not None else 0, start_index)]
+    while heap:
+        _, index = heapq.heappop(heap)
+        if settled[index]:
+            continue
+        settled[index] = True
+        if index == end_index:
+            break
+
+        # Relax every edge of the settled satellite at once, only improved neighbours go on the heap
+        neighbours = indices[indptr[index]:indptr[index + 1]]
+        candidates = distance[index] + distances[indptr[index]:indptr[index + 1]]
+        improved = available[neighbours] & (candidates < distance[neighbours])
+        neighbours, candidates = neighbours[improved], candidates[improved]
+        distance[neighbours] = candidates
+        parent[neighbours] = index
+        keys = candidates + heuristic[neighbours] if heuristic is not None else candidates
+        for item in zip(keys.tolist(), neighbours.tolist()):
+            heapq.heappush(heap, item)
+
+    return distance, parent
+
+def great_circle_heuristic(longitudes, latitudes, heights, end_index, earth_radius):
+    # Admissible A* heuristic, the arc to the end satellite at the lowest height in the constellation
+    # Every hop is at least as long as this arc over its share of the angle
+    lowest = np.min(heights)
+    return arc_distance(longitudes, latitudes, lowest, longitudes[end_index], latitudes[end_index], lowest, earth_radius)
+
+def tree_path(parent, start_index, end_index):
+    # Follows parent pointers back from end_index, [] if it wasn't reached
+    if end_index != start_index and parent[end_index] < 0:
+        return []
+    path = [end_index]
+    while path[-1] != start_index:
+        path.append(int(parent[path[-1]]))
+    return path[::-1]
+
+class RoutingTable:
+    # Next hop for every (source, destination) pair, next_hops[source, destination] is the satellite to forward to
+    # Unreachable pairs hold -1, a satellite's next hop to itself is itself
+
+    def __init__(self, next_hops):
+        self.next_hops = next_hops
+
+    @classmethod
+    def build(cls, indptr, indices, distances, available):
+        # Shortest paths by distance between all pairs, with the same neighbours as shortest_path_tree
+        num_satellites = len(available)
+        dtype = np.int16 if num_satellites <= np.iinfo(np.int16).max else np.int32
+        rows = np.repeat(np.arange(num_satellites), np.diff(indptr))
+        keep = available[indices]
+        rows, cols, weights = rows[keep], indices[keep], distances[keep]
+
+        if shortest_path is not None:
+            # Dijkstra from every destination over the reversed edges, each satellite's predecessor there is its next hop
+            reverse = csr_matrix((weights, (cols, rows)), shape=(num_satellites, num_satellites))
+            _, predecessors = shortest_path(reverse, method='D', return_predecessors=True)
+            next_hops = predecessors.T.astype(dtype)
+            next_hops[next_hops < 0] = -1 # scipy marks missing predecessors with -9999
+        else:
+            # Vectorized Floyd-Warshall, one sweep over the whole matrix per intermediate satellite
+            distance = np.full((num_satellites, num_satellites), np.inf)
+            distance[rows, cols] = weights
+            next_hops = np.full((num_satellites, num_satellites), -1, dtype=dtype)
+            next_hops[rows, cols] = cols
+            for k in range(num_satellites):
+                through = distance[:, k, np.newaxis] + distance[np.newaxis, k, :]
+                shorter = through < distance
+                np.copyto(distance, through, where=shorter)
+                np.copyto(next_hops, np.broadcast_to(next_hops[:, k, np.newaxis], next_hops.shape), where=shorter)
+
+        diagonal = np.arange(num_satellites)
+        next_hops[diagonal, diagonal] = diagonal
+        return cls(next_hops)
+
+    def path(self, start_index, end_index):
+        # Follows next hops from start_index, [] if end_index can't be reached
+        path = [start_index]
+        while path[-1] != end_index:
+            next_index = int(self.next_hops[path[-1], end_index])
+            if next_index < 0 or len(path) > len(self.next_hops): # Unreachable, or a corrupt table that loops
+                return []
+            path.append(next_index)
+        return path
+
+    def save(self, path):
+        np.save(path, self.next_hops)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        # Memory-maps the table by default, only the rows that are looked up get read from disk
+        return cls(np.load(path, mmap_mode=mmap_mode))
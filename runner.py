@@ -0,0 +1,162 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from constellation import Constellation
+import distributions
+
+# Headless experiment runner, streams one JSON Lines record per routed pair and can resume an interrupted sweep
+# python runner.py scenario.json results.jsonl
+#
+# A scenario is a JSON object, every key is optional:
+# {
+#     "sizes": [100, 1000],                # Satellites per constellation
+#     "distributions": ["random"],         # Names from distributions.DISTRIBUTIONS
+#     "seeds": [0, 1, 2],                  # One constellation (and set of random pairs) per seed
+#     "pairs": 10,                         # Number of random (start, end) pairs, or an explicit list of them
+#     "routers": ["train", "flood"],       # Methods accepted by Constellation.route
+#     "height": 0, "speed": 0.5,
+#     "settings": {"MAX_ITERATIONS": 500}  # Satellite and Constellation settings, see Constellation.apply_settings
+# }
+DEFAULT_SCENARIO = {
+    'sizes': [100],
+    'distributions': ['random'],
+    'seeds': [0],
+    'pairs': 1,
+    'routers': ['train', 'flood'],
+    'height': 0,
+    'speed': 0.5,
+    'settings': {},
+}
+KEY_FIELDS = ('size', 'distribution', 'seed', 'start', 'end', 'router') # Identify a record when resuming
+
+def load_scenario(path):
+    with open(path) as file:
+        scenario = dict(DEFAULT_SCENARIO, **json.load(file))
+    unknown = set(scenario['distributions']) - set(distributions.DISTRIBUTIONS)
+    if unknown:
+        raise ValueError(f"Unknown distributions: {', '.join(sorted(unknown))}")
+    return scenario
+
+def scenario_pairs(scenario, size, seed):
+    # Explicit pairs, or random distinct pairs drawn from the seed so a resumed run draws the same ones
+    if not isinstance(scenario['pairs'], int):
+        return [(int(start), int(end)) for start, end in scenario['pairs']]
+    rng = np.random.default_rng(seed)
+    return [tuple(int(i) for i in rng.choice(size, 2, replace=False)) for _ in range(scenario['pairs'])]
+
+def drop_partial_line(path):
+    # Truncates a last line left without its newline by a run that died while writing it
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as file:
+        data = file.read()
+        if data and not data.endswith(b'\n'):
+            file.truncate(data.rfind(b'\n') + 1)
+
+def completed_keys(path):
+    # Keys of the records already in the output, a line cut short by an interrupted run is ignored
+    keys = set()
+    if not os.path.exists(path):
+        return keys
+    with open(path) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            keys.add(tuple(record[field] for field in KEY_FIELDS))
+    return keys
+
+def path_stats(constellation, router, path, start_index, end_index):
+    # Same statistics as Constellation.compare_routing_methods, path holds satellite indices
+    satellites = constellation.satellites
+    if router == 'flood': # Connections formed while flooding
+        hops = [(a, b) for a, b in path]
+        reached = any(b == end_index for _, b in path)
+    else:
+        if router == 'time_expanded':
+            path = [index for index, _ in path]
+        hops = list(zip(path, path[1:]))
+        reached = bool(path) and path[-1] == end_index
+    return {
+        'path': path,
+        'reached': reached,
+        'num_satellites': len(path),
+        'distance': float(sum(satellites[a].distance_to(b) for a, b in hops)),
+        'true_distance': float(satellites[start_index].distance_to(end_index)),
+    }
+
+def as_indices(router, path):
+    if router == 'flood':
+        return [[sat1.index, sat2.index] for sat1, sat2 in path]
+    if router == 'time_expanded':
+        return [[sat.index, tick] for sat, tick in path]
+    return [sat.index for sat in path]
+
+def run(scenario, output, resume=True, workers=None, log=sys.stderr):
+    # Routes every (size, distribution, seed, pair, router) of the scenario not already in output, appending to it
+    if resume:
+        drop_partial_line(output)
+    done = completed_keys(output) if resume else set()
+    constellation = Constellation()
+    constellation.apply_settings(scenario['settings'])
+    written = 0
+
+    with open(output, 'a' if resume else 'w') as file:
+        def write(record):
+            nonlocal written
+            file.write(json.dumps(record) + '\n')
+            file.flush() # Every finished record survives the run dying
+            written += 1
+
+        for size, distribution, seed in itertools.product(scenario['sizes'], scenario['distributions'], scenario['seeds']):
+            pairs = scenario_pairs(scenario, size, seed)
+            satellites = None
+            for router in scenario['routers']:
+                base = {'size': size, 'distribution': distribution, 'seed': seed, 'router': router}
+                pending = [(s, e) for s, e in pairs if (size, distribution, seed, s, e, router) not in done]
+                if not pending:
+                    continue
+                if satellites is None:
+                    satellites = distributions.make_satellites(size, distribution, seed, scenario['height'], scenario['speed'])
+                    constellation.precompute_matrices(satellites)
+
+                if workers:
+                    # Pairs come back as soon as any worker finishes one, timings and metrics aren't per pair
+                    for (start_index, end_index), path in constellation.route_pairs(satellites, pending, router, workers):
+                        write(dict(base, start=start_index, end=end_index, seconds=None, metrics=None,
+                                   **path_stats(constellation, router, path, start_index, end_index)))
+                    continue
+
+                for start_index, end_index in pending:
+                    # Every pair starts from zero and the same random state, so results don't depend on what ran before
+                    constellation.reset_q_values()
+                    constellation.reset_metrics()
+                    np.random.seed(seed)
+                    started = time.perf_counter()
+                    path = constellation.route(router, start_index, end_index)
+                    seconds = time.perf_counter() - started
+                    write(dict(base, start=start_index, end=end_index, seconds=seconds, metrics=constellation.metrics.as_dict(),
+                               **path_stats(constellation, router, as_indices(router, path), start_index, end_index)))
+                print(f"{router} {size} {distribution} seed {seed}: {len(pending)} pairs", file=log)
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Route the pairs of a scenario and stream the results as JSON Lines")
+    parser.add_argument('scenario', help="Scenario JSON file")
+    parser.add_argument('output', help="JSON Lines file results are appended to")
+    parser.add_argument('--restart', action='store_true', help="Overwrite the output instead of resuming it")
+    parser.add_argument('--workers', type=int, help="Route pairs on a process pool of this size")
+    args = parser.parse_args(argv)
+
+    written = run(load_scenario(args.scenario), args.output, resume=not args.restart, workers=args.workers)
+    print(f"{written} records written to {args.output}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
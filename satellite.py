@@ -1,6 +1,29 @@
 import numpy as np
 
+def cartesian_coordinates(longitudes, latitudes, heights):
+    # Convert arrays of spherical (longitude, latitude, height) to Cartesian (x, y, z), one row per satellite
+    r = 1 + np.asarray(heights, dtype=float) # Assume base radius is 1
+    lon = np.radians(longitudes)
+    lat = np.radians(latitudes)
+    x = r * np.cos(lat) * np.cos(lon)
+    y = r * np.cos(lat) * np.sin(lon)
+    z = r * np.sin(lat)
+    return np.column_stack((x, y, z))
+
+def state_attribute(name):
+    # Property reading and writing this satellite's row of a ConstellationState array
+    def get(self):
+        return getattr(self.state, name)[self.index]
+    def set(self, value):
+        getattr(self.state, name)[self.index] = value
+    return property(get, set)
+
 class Satellite:
+    # A view onto one row of a ConstellationState, index is both the row and the index in the constellation network
+    # Topology and settings are read from the TopologyContext of that state
+    __slots__ = ('state', 'index', 'Q')
+
+    # Default settings of new TopologyContexts
     EARTH_RADIUS = 6371
 
     # State Thresholds
@@ -11,39 +34,63 @@ class Satellite:
     CONGESTION_MEDIUM = 3 # Max connections for medium congestion, anything above is high
     CONGESTION_HIGH = 5 # Can't accept connections after this value
 
+    # State levels, shared by latency and congestion
+    LOW = 0
+    MEDIUM = 1
+    HIGH = 2
+    LEVELS = ('low', 'medium', 'high') # Level names, indexed by level code
+    NUM_STATES = len(LEVELS) ** 2 # One state code per (latency, congestion) pair
+
+    # Reward lookup tables, indexed by level code and by state code
+    LEVEL_REWARDS = np.array([-1, -5, -10])
+    STATE_REWARDS = (LEVEL_REWARDS[:, np.newaxis] + LEVEL_REWARDS[np.newaxis, :]).ravel()
+
     ALPHA = 0.50 # learning rate (α)
     GAMMA = 0.95 # discount factor (γ)
     EPSILON = 0.1  # exploration rate (ε)
 
-    index = 0 # Satellite index in the constellation network
-
-    # Class variables for precomputed matrices
-    satellites = []
-    visibility_matrix = [[]]
-    distance_matrix = [[]]
-    latency_matrix = [[]]
+    longitude = state_attribute('longitude')
+    latitude = state_attribute('latitude')
+    height = state_attribute('height')
+    speed = state_attribute('speed') # Speed in degrees per update cycle
 
     def __init__(self, longitude, latitude, height, speed):
-        self.longitude = longitude
-        self.latitude = latitude
-        self.height = height
-        self.speed = speed  # Speed in degrees per update cycle
-        self.num_connections = 0 # Number active connections 
+        # A new satellite owns a single row state until it joins a constellation
+        self.state = ConstellationState([longitude], [latitude], [height], [speed])
+        self.index = 0
         self.Q = {}
-        self.satellites # Other satellites in the constellation network
-    
+
+    @classmethod
+    def view(cls, state, index):
+        # Satellite backed by an existing row of state
+        satellite = cls.__new__(cls)
+        satellite.state = state
+        satellite.index = index
+        satellite.Q = {}
+        return satellite
+
+    @property
+    def context(self):
+        return self.state.context
+
+    @property
+    def num_connections(self): # Number active connections
+        return int(self.state.num_connections[self.index])
+
+    @num_connections.setter
+    def num_connections(self, value):
+        # Keep the shared availability mask in sync as connections cross CONGESTION_HIGH
+        self.state.num_connections[self.index] = value
+        context = self.context
+        if self.index < len(context.available) and context.satellites[self.index] is self:
+            context.available[self.index] = value < context.CONGESTION_HIGH
+
     def update_position(self): # Moves satellite 1 speed increment
         self.longitude = (self.longitude + self.speed) % 360  # Wrap longitude within 0-360 degrees
 
     def get_cartesian_coordinates(self):
         # Convert spherical (longitude, latitude, height) to Cartesian (x, y, z)
-        r = 1 + self.height  # Assume base radius is 1
-        lon = np.radians(self.longitude)
-        lat = np.radians(self.latitude)
-        x = r * np.cos(lat) * np.cos(lon)
-        y = r * np.cos(lat) * np.sin(lon)
-        z = r * np.sin(lat)
-        return np.array([x, y, z])
+        return cartesian_coordinates(self.longitude, self.latitude, self.height)[0]
 
     def out_of_sight(self, other):
         # Checks if the other satellite is out of sight
@@ -75,8 +122,8 @@ class Satellite:
         c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
         
         # Adjust for the altitude of satellites
-        r1 = self.EARTH_RADIUS + self.height
-        r2 = self.EARTH_RADIUS + other.height
+        r1 = self.context.EARTH_RADIUS + self.height
+        r2 = self.context.EARTH_RADIUS + other.height
         
         # Use the average radius for great circle distance
         r_avg = (r1 + r2) / 2
@@ -85,70 +132,167 @@ class Satellite:
         distance = r_avg * c
         return distance
 
+    def distance_to(self, other):
+        # Precomputed distance, or computed directly when there is no dense distance matrix
+        if(isinstance(other, Satellite)):
+            other = other.index
+        context = self.context
+        if context.distance_matrix is None:
+            return 0 if other == self.index else self.calculate_distance(context.satellites[other])
+        return context.distance_matrix[self.index, other]
+
     def check_latency(self, other):
-        if(type(other) == int):
-            return Satellite.latency_matrix[self.index][other]
-        elif(type(other) == Satellite):
-            return Satellite.latency_matrix[self.index][other.index]
+        if(isinstance(other, Satellite)):
+            other = other.index
+        context = self.context
+        if context.latency_matrix is None:
+            distance = self.distance_to(other)
+            if distance <= context.DELAY_LOW or other == self.index:
+                return self.LOW
+            elif distance <= context.DELAY_MEDIUM:
+                return self.MEDIUM
+            else:
+                return self.HIGH
+        return int(context.latency_matrix[self.index, other])
 
     def check_congestion(self):
-        if self.num_connections <= self.CONGESTION_LOW:
-            return 'low'
-        elif self.num_connections <= self.CONGESTION_MEDIUM:
-            return 'medium'
+        if self.num_connections <= self.context.CONGESTION_LOW:
+            return self.LOW
+        elif self.num_connections <= self.context.CONGESTION_MEDIUM:
+            return self.MEDIUM
         else:
-            return 'high'
+            return self.HIGH
 
     def get_state(self, endpoint_satellite):
+        # Encodes (latency, congestion) as a single state code
         delay_state = self.check_latency(endpoint_satellite)
         congestion_state = self.check_congestion()
-        return (delay_state, congestion_state)
+        return delay_state * len(self.LEVELS) + congestion_state
 
-    def get_possible_actions(self):
-        possible_actions = []
-
-        for i in range(len(self.satellites)):
-            visible = Satellite.visibility_matrix[self.index][i]
-            if visible and i != self.index:
-                sat = Satellite.satellites[i]
+    def get_neighbours(self):
+        # Indices of reachable satellites that aren't congested, read from the neighbour index
+        context = self.context
+        start = context.neighbour_indptr[self.index]
+        stop = context.neighbour_indptr[self.index + 1]
+        neighbours = context.neighbour_indices[start:stop]
+        return neighbours[context.available[neighbours]]
 
-                # Check if satellite is congested (max number connections)
-                if sat.num_connections < self.CONGESTION_HIGH:
-                    if self.DELAY_HIGH:
-                        distance = Satellite.distance_matrix[self.index][i]
-                        if distance < self.DELAY_HIGH:
-                            possible_actions.append(sat)
-                    else:
-                        possible_actions.append(sat)
-               
-
-        return possible_actions
+    def get_possible_actions(self):
+        satellites = self.context.satellites
+        return [satellites[i] for i in self.get_neighbours().tolist()]
 
     def get_reward(self, state, is_final=False, relay_penalty=-1):
-        # Calculate reward for given state
-        delay_state, congestion_state = state
-        delay_reward = {'low': -1, 'medium': -5, 'high': -10}[delay_state]
-        congestion_reward = {'low': -1, 'medium': -5, 'high': -10}[congestion_state]
-        total_reward = delay_reward + congestion_reward - relay_penalty
-        if is_final: # Reward for reaching the endpoint
-            total_reward += 100
+        # Calculate reward for given state code, delay and congestion rewards are summed in STATE_REWARDS
+        total_reward = self.STATE_REWARDS[state] - relay_penalty
+        total_reward += 100 * is_final # Reward for reaching the endpoint, also works on arrays of states
         return total_reward
 
+    def get_q_values(self, state, actions):
+        # Q-values of the given actions, Q is either a dict or this satellite's slice of a QTable
+        if isinstance(self.Q, dict):
+            return [self.Q.get((state, a), 0) for a in actions]
+        return self.Q[state, [a.index for a in actions]].tolist()
+
+    def set_q_value(self, state, action, value):
+        if isinstance(self.Q, dict):
+            self.Q[(state, action)] = value
+        else:
+            self.Q[state, action.index] = value
+
     def update_q_value(self, state_current, action_current, reward, state_next):
         # Q(s, a) <- Q(s, a) + \alpha * [r + \gamma * max_a(Q(s_next, a')) - Q(s, a)]
-        max_q_next = max([self.Q.get((state_next, a), 0) for a in self.get_possible_actions()], default=0)
-        q_current = self.Q.get((state_current, action_current), 0)
-        q_new = q_current + self.ALPHA * (reward + self.GAMMA * max_q_next - q_current)
-        self.Q[(state_current, action_current)] = q_new
+        max_q_next = max(self.get_q_values(state_next, self.get_possible_actions()), default=0)
+        q_current = self.get_q_values(state_current, [action_current])[0]
+        q_new = q_current + self.context.ALPHA * (reward + self.context.GAMMA * max_q_next - q_current)
+        self.set_q_value(state_current, action_current, q_new)
 
     def choose_action(self, state_current, possible_actions):
-        if np.random.rand() < self.EPSILON: # Exploration
+        if np.random.rand() < self.context.EPSILON: # Exploration
             return np.random.choice(possible_actions)
         else: # Exploitation
-            q_values = [self.Q.get((state_current, a), 0) for a in possible_actions]
+            q_values = self.get_q_values(state_current, possible_actions)
             max_q = max(q_values)
             best_actions = [a for a, q in zip(possible_actions, q_values) if q == max_q]
             return np.random.choice(best_actions)
 
     def __repr__(self):
-        return f"sat_%03d" % self.index
\ No newline at end of file
+        return f"sat_%03d" % self.index
+
+class TopologyContext:
+    # Topology and settings of one constellation, shared by the satellites of its ConstellationState and by its routers
+    # Each Constellation has its own, so several can be precomputed and routed side by side, e.g. in threads
+    SETTINGS = ('EARTH_RADIUS', 'ALPHA', 'GAMMA', 'EPSILON', 'DELAY_LOW', 'DELAY_MEDIUM', 'DELAY_HIGH', 'CONGESTION_LOW', 'CONGESTION_MEDIUM', 'CONGESTION_HIGH')
+
+    def __init__(self, **settings):
+        # Settings not given default to the Satellite class attributes
+        for name in self.SETTINGS:
+            setattr(self, name, settings.get(name, getattr(Satellite, name)))
+
+        # Precomputed matrices, None when the constellation uses the sparse topology
+        self.satellites = []
+        self.visibility_matrix = None
+        self.distance_matrix = None
+        self.latency_matrix = None
+
+        # Neighbour index, in CSR form (see topology.compute_adjacency)
+        self.neighbour_indptr = np.zeros(1, dtype=np.int64)
+        self.neighbour_indices = np.zeros(0, dtype=np.int32)
+        self.neighbour_distances = np.zeros(0) # Distance to each neighbour, aligned with neighbour_indices
+        self.available = np.zeros(0, dtype=bool) # Satellites that can still accept connections
+
+    def settings(self):
+        return {name: getattr(self, name) for name in self.SETTINGS}
+
+class ConstellationState:
+    # Satellite attributes stored as contiguous arrays, one row per satellite
+    # context is the TopologyContext the satellites read their topology and settings from
+
+    def __init__(self, longitude=(), latitude=(), height=(), speed=(), num_connections=None, context=None):
+        self.context = context if context is not None else TopologyContext()
+        self.longitude = np.array(longitude, dtype=float)
+        self.latitude = np.array(latitude, dtype=float)
+        self.height = np.array(height, dtype=float)
+        self.speed = np.array(speed, dtype=float)
+        if num_connections is None:
+            num_connections = np.zeros(len(self.longitude))
+        self.num_connections = np.array(num_connections, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.longitude)
+
+    @classmethod
+    def from_satellites(cls, satellites):
+        # Copies the satellites' current attributes into a new state and turns them into views onto it
+        # The new state keeps the context of the first satellite
+        state = cls(
+            [sat.longitude for sat in satellites],
+            [sat.latitude for sat in satellites],
+            [sat.height for sat in satellites],
+            [sat.speed for sat in satellites],
+            [sat.num_connections for sat in satellites],
+            satellites[0].context if satellites else None
+        )
+        for i, sat in enumerate(satellites):
+            sat.state = state
+            sat.index = i
+        return state
+
+    @classmethod
+    def of(cls, satellites):
+        # The state backing the satellites, rebuilt if they aren't rows 0..N-1 of one state in list order
+        state = satellites[0].state if satellites else None
+        if state is None or len(state) != len(satellites) or any(sat.state is not state or sat.index != i for i, sat in enumerate(satellites)):
+            state = cls.from_satellites(satellites)
+        return state
+
+    def satellites(self):
+        # One Satellite view per row
+        return [Satellite.view(self, i) for i in range(len(self))]
+
+    def step(self, dt=1):
+        # Moves every satellite dt speed increments, wrapping longitude within 0-360 degrees
+        self.longitude += self.speed * dt
+        np.mod(self.longitude, 360, out=self.longitude)
+
+    def cartesian(self):
+        return cartesian_coordinates(self.longitude, self.latitude, self.height)
@@ -0,0 +1,33 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+class SharedArrays:
+    # Copies named NumPy arrays into shared memory once, so worker processes can map them instead of unpickling copies
+
+    def __init__(self, arrays):
+        self.blocks = []
+        self.spec = {} # name -> (block name, shape, dtype), small enough to pass to every worker
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    @staticmethod
+    def attach(spec):
+        # Maps the arrays described by spec, the returned blocks must stay referenced while the arrays are in use
+        blocks = []
+        arrays = {}
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        return blocks, arrays
+
+    def close(self):
+        # Releases the shared memory, only the process that created it should call this
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
@@ -0,0 +1,273 @@
+import numpy as np
+from satellite import Satellite, cartesian_coordinates
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError: # Optional, compute_sparse_adjacency scans blocks of rows without it
+    cKDTree = None
+
+LINE_OF_SIGHT = 75 # Max angle (degrees) between two satellites that can still see each other
+BLOCK_SIZE = 512 # Rows computed per batch, bounds the size of temporary arrays
+KDTREE_MAX_COVERAGE = 0.05 # Use the KD-tree when the neighbour cone covers less than this fraction of the sphere
+
+def unit_vectors(longitudes, latitudes, heights):
+    # Normalized position vectors, used for line-of-sight checks
+    vectors = cartesian_coordinates(longitudes, latitudes, heights)
+    return vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+
+def great_circle_arcs(longitudes1, latitudes1, longitudes2, latitudes2, num_points=50):
+    # Points along the great circle between each pair of positions on the unit sphere, shape (edges, num_points, 3)
+    lat1, lon1 = np.radians(latitudes1)[:, np.newaxis], np.radians(longitudes1)[:, np.newaxis]
+    lat2, lon2 = np.radians(latitudes2)[:, np.newaxis], np.radians(longitudes2)[:, np.newaxis]
+
+    # Calculate the angle between the two points
+    cos_d = np.sin(lat1) * np.sin(lat2) + np.cos(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    d = np.arccos(np.clip(cos_d, -1, 1))
+
+    # Spherical interpolation weights, falls back to linear when the points (nearly) coincide and sin(d) ~ 0
+    t = np.linspace(0, 1, num_points)[np.newaxis, :]
+    sin_d = np.sin(d)
+    degenerate = sin_d < 1e-9
+    sin_d = np.where(degenerate, 1, sin_d)
+    A = np.where(degenerate, 1 - t, np.sin((1 - t) * d) / sin_d)
+    B = np.where(degenerate, t, np.sin(t * d) / sin_d)
+
+    start = np.stack((np.cos(lat1) * np.cos(lon1), np.cos(lat1) * np.sin(lon1), np.sin(lat1)), axis=-1)
+    end = np.stack((np.cos(lat2) * np.cos(lon2), np.cos(lat2) * np.sin(lon2), np.sin(lat2)), axis=-1)
+    return A[..., np.newaxis] * start + B[..., np.newaxis] * end
+
+def in_sight(dot_product):
+    # Same test as Satellite.out_of_sight (negated), from the dot product of two unit vectors
+    with np.errstate(invalid='ignore'): # arccos is nan just outside [-1, 1], which counts as visible
+        angle = np.degrees(np.arccos(dot_product))
+    return ~(angle > LINE_OF_SIGHT)
+
+def visibility_block(units_a, units_b):
+    # Line of sight for every pair between the two sets of unit vectors
+    return in_sight(units_a @ units_b.T)
+
+def arc_distance(lon_a, lat_a, height_a, lon_b, lat_b, height_b, earth_radius):
+    # Same haversine arc distance as Satellite.calculate_distance, element-wise over broadcast arrays
+    lat1, lon1 = np.radians(lat_a), np.radians(lon_a)
+    lat2, lon2 = np.radians(lat_b), np.radians(lon_b)
+
+    delta_lat = lat2 - lat1
+    delta_lon = lon2 - lon1
+    a = np.sin(delta_lat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    # Use the average radius for great circle distance
+    r_avg = ((earth_radius + height_a) + (earth_radius + height_b)) / 2
+    return r_avg * c
+
+def distance_block(lon_a, lat_a, height_a, lon_b, lat_b, height_b, earth_radius):
+    # Arc distance for every pair between the two sets
+    return arc_distance(
+        lon_a[:, np.newaxis], lat_a[:, np.newaxis], height_a[:, np.newaxis],
+        lon_b[np.newaxis, :], lat_b[np.newaxis, :], height_b[np.newaxis, :],
+        earth_radius
+    )
+
+def latency_levels(distances, delay_low, delay_medium):
+    # Maps distances to latency level codes, one byte per entry
+    levels = np.full(np.shape(distances), Satellite.HIGH, dtype=np.uint8)
+    levels[distances <= delay_medium] = Satellite.MEDIUM
+    levels[distances <= delay_low] = Satellite.LOW
+    return levels
+
+def compute_adjacency(visibility_matrix, distance_matrix, delay_high=0):
+    # Neighbour index in CSR form, satellite i's neighbours are indices[indptr[i]:indptr[i + 1]] in ascending order
+    # Keeps visible pairs, and if delay_high is set only those closer than delay_high
+    # distances holds the distance of each neighbour, aligned with indices
+    reachable = visibility_matrix
+    if delay_high:
+        reachable = reachable & (distance_matrix < delay_high)
+
+    indptr = np.zeros(len(reachable) + 1, dtype=np.int64)
+    np.cumsum(np.count_nonzero(reachable, axis=1), out=indptr[1:])
+    rows, indices = np.nonzero(reachable)
+    return indptr, indices.astype(np.int32), distance_matrix[rows, indices]
+
+def update_adjacency(adjacency, rows, visibility_matrix, distance_matrix, delay_high=0):
+    # Same neighbour index as compute_adjacency after the given rows (and columns) of the matrices changed
+    # Keeps the edges between satellites that didn't move and only reads the moved rows of the matrices,
+    # so the work grows with the moved rows and the number of edges rather than N×N (without delay_high most visible
+    # pairs are edges and it saves little over compute_adjacency)
+    indptr, indices, distances = adjacency
+    num_satellites = len(indptr) - 1
+    rows = np.asarray(rows, dtype=np.int64)
+    moved = np.zeros(num_satellites, dtype=bool)
+    moved[rows] = True
+
+    old_rows = np.repeat(np.arange(num_satellites), np.diff(indptr))
+    keep = ~moved[old_rows] & ~moved[indices]
+
+    reachable = visibility_matrix[rows]
+    if delay_high:
+        reachable = reachable & (distance_matrix[rows] < delay_high)
+    new_rows, new_cols = np.nonzero(reachable)
+    new_rows = rows[new_rows]
+
+    # The matrices are symmetric, every edge of a moved row also appears in the row of a satellite that didn't move
+    mirrored = ~moved[new_cols]
+    new_rows, new_cols = np.concatenate((new_rows, new_cols[mirrored])), np.concatenate((new_cols, new_rows[mirrored]))
+    new_distances = distance_matrix[new_rows, new_cols]
+
+    # Kept edges are still sorted by (row, column), merge the new ones in without sorting everything again
+    kept_rows, kept_cols = old_rows[keep], indices[keep]
+    order = np.argsort(new_rows * num_satellites + new_cols)
+    new_rows, new_cols, new_distances = new_rows[order], new_cols[order], new_distances[order]
+    positions = np.searchsorted(kept_rows * num_satellites + kept_cols, new_rows * num_satellites + new_cols)
+
+    indptr = np.zeros(num_satellites + 1, dtype=np.int64)
+    np.cumsum(np.bincount(kept_rows, minlength=num_satellites) + np.bincount(new_rows, minlength=num_satellites), out=indptr[1:])
+    indices = np.insert(kept_cols, positions, new_cols.astype(np.int32))
+    distances = np.insert(distances[keep], positions, new_distances)
+    return indptr, indices, distances
+
+def compute_sparse_adjacency(longitudes, latitudes, heights, earth_radius, delay_high=0):
+    # Same neighbour index as compute_adjacency, built without any dense N×N matrix
+    # Candidate pairs come from a KD-tree over unit vectors when scipy is installed and the neighbour cone is narrow,
+    # otherwise from scanning row blocks (a wide cone matches most pairs and the tree only adds overhead)
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    heights = np.asarray(heights, dtype=float)
+    num_satellites = len(longitudes)
+    units = unit_vectors(longitudes, latitudes, heights)
+
+    # Widest angle a neighbour can be at, the line-of-sight cone narrowed by delay_high
+    max_angle = np.radians(LINE_OF_SIGHT)
+    if delay_high and num_satellites:
+        max_angle = min(max_angle, delay_high / (earth_radius + heights.min()))
+
+    coverage = (1 - np.cos(max_angle)) / 2 # Fraction of the sphere's surface inside the cone
+    if cKDTree is not None and coverage < KDTREE_MAX_COVERAGE:
+        # Chord length on the unit sphere, padded so rounding never drops a pair the exact checks would keep
+        radius = 2 * np.sin(max_angle / 2) + 1e-9
+        pairs = cKDTree(units).query_pairs(radius, output_type='ndarray')
+        rows = np.concatenate((pairs[:, 0], pairs[:, 1]))
+        cols = np.concatenate((pairs[:, 1], pairs[:, 0]))
+
+        # Same exact checks as the dense matrices
+        visible = in_sight(np.einsum('ij,ij->i', units[rows], units[cols]))
+        distances = arc_distance(
+            longitudes[rows], latitudes[rows], heights[rows],
+            longitudes[cols], latitudes[cols], heights[cols],
+            earth_radius
+        )
+        keep = visible & (distances < delay_high) if delay_high else visible
+        rows, cols, distances = rows[keep], cols[keep], distances[keep]
+
+        order = np.lexsort((cols, rows))
+        indices = cols[order].astype(np.int32)
+        distances = distances[order]
+        counts = np.bincount(rows, minlength=num_satellites)
+    else:
+        # Each block of rows against every column, only the reachable pairs are kept
+        indices = []
+        distances = []
+        counts = np.zeros(num_satellites, dtype=np.int64)
+        for start in range(0, num_satellites, BLOCK_SIZE):
+            rows = slice(start, min(start + BLOCK_SIZE, num_satellites))
+            reachable = visibility_block(units[rows], units)
+            reachable[np.arange(reachable.shape[0]), np.arange(start, rows.stop)] = False # Not itself
+            distance = distance_block(
+                longitudes[rows], latitudes[rows], heights[rows],
+                longitudes, latitudes, heights,
+                earth_radius
+            )
+            if delay_high:
+                reachable &= distance < delay_high
+
+            counts[rows] = np.count_nonzero(reachable, axis=1)
+            block_rows, block_cols = np.nonzero(reachable)
+            indices.append(block_cols.astype(np.int32))
+            distances.append(distance[block_rows, block_cols])
+        indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32)
+        distances = np.concatenate(distances) if distances else np.zeros(0)
+
+    indptr = np.zeros(num_satellites + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, indices, distances
+
+def neighbour_table(indptr, indices, available):
+    # Pads the CSR neighbour index into an (N, max_degree) array for batched lookups
+    # Unavailable neighbours and padding are marked False in the returned mask
+    degrees = np.diff(indptr)
+    width = max(int(degrees.max(initial=0)), 1)
+    slots = np.arange(width)[np.newaxis, :]
+    in_row = slots < degrees[:, np.newaxis]
+
+    table = np.zeros((len(degrees), width), dtype=np.int64)
+    table[in_row] = indices
+    mask = in_row & available[table]
+    return table, mask
+
+def compute_matrices(longitudes, latitudes, heights, earth_radius, delay_low, delay_medium):
+    # Builds the visibility, distance and latency matrices for a whole constellation at once
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    heights = np.asarray(heights, dtype=float)
+    num_satellites = len(longitudes)
+
+    visibility_matrix = np.zeros((num_satellites, num_satellites), dtype=bool)
+    distance_matrix = np.zeros((num_satellites, num_satellites))
+    units = unit_vectors(longitudes, latitudes, heights)
+
+    # Both matrices are symmetric, only compute the upper triangle of each block row and mirror it
+    for start in range(0, num_satellites, BLOCK_SIZE):
+        rows = slice(start, min(start + BLOCK_SIZE, num_satellites))
+        cols = slice(start, num_satellites)
+
+        visible = visibility_block(units[rows], units[cols])
+        visibility_matrix[rows, cols] = visible
+        visibility_matrix[cols, rows] = visible.T
+
+        distance = distance_block(
+            longitudes[rows], latitudes[rows], heights[rows],
+            longitudes[cols], latitudes[cols], heights[cols],
+            earth_radius
+        )
+        distance_matrix[rows, cols] = distance
+        distance_matrix[cols, rows] = distance.T
+
+    # A satellite can't see or route to itself
+    np.fill_diagonal(visibility_matrix, False)
+    np.fill_diagonal(distance_matrix, 0)
+
+    latency_matrix = latency_levels(distance_matrix, delay_low, delay_medium)
+    np.fill_diagonal(latency_matrix, Satellite.LOW)
+
+    return visibility_matrix, distance_matrix, latency_matrix
+
+def update_matrices(matrices, rows, longitudes, latitudes, heights, earth_radius, delay_low, delay_medium):
+    # Recomputes the given rows, and the matching columns, of the (visibility, distance, latency) matrices in place
+    visibility_matrix, distance_matrix, latency_matrix = matrices
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    heights = np.asarray(heights, dtype=float)
+    units = unit_vectors(longitudes, latitudes, heights)
+
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = rows[start:start + BLOCK_SIZE]
+
+        visible = visibility_block(units[block], units)
+        visibility_matrix[block, :] = visible
+        visibility_matrix[:, block] = visible.T
+
+        distance = distance_block(
+            longitudes[block], latitudes[block], heights[block],
+            longitudes, latitudes, heights,
+            earth_radius
+        )
+        distance_matrix[block, :] = distance
+        distance_matrix[:, block] = distance.T
+
+        latency = latency_levels(distance, delay_low, delay_medium)
+        latency_matrix[block, :] = latency
+        latency_matrix[:, block] = latency.T
+
+    # A satellite can't see or route to itself
+    visibility_matrix[rows, rows] = False
+    distance_matrix[rows, rows] = 0
+    latency_matrix[rows, rows] = Satellite.LOW